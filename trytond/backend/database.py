@@ -1,5 +1,7 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+from threading import Lock
+
 from trytond.config import config
 
 DatabaseIntegrityError = None
@@ -99,6 +101,26 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
+    def has_channel(self):
+        '''
+        Return True if database supports notification channels.
+
+        :return: a boolean
+        '''
+        return False
+
+    def listen(self, channel):
+        '''
+        Listen on a notification channel using a dedicated connection.
+        It yields None each time the channel is listened, also after a
+        reconnection, and then the payload of each notification received.
+        It stops when the database is closed.
+
+        :param channel: the channel name
+        :return: an iterator
+        '''
+        raise NotImplementedError
+
 
 class CursorInterface(object):
     '''
@@ -106,6 +128,8 @@ class CursorInterface(object):
     '''
     IN_MAX = 1000
     cache_keys = {'language', 'fuzzy_translation', '_datetime'}
+    _statistics = {}
+    _statistics_lock = Lock()
 
     def __init__(self):
         self.cache = {}
@@ -113,12 +137,60 @@ class CursorInterface(object):
     def get_cache(self):
         from trytond.cache import LRUDict
         from trytond.transaction import Transaction
-        user = Transaction().user
-        context = Transaction().context
-        keys = tuple(((key, context[key]) for key in sorted(self.cache_keys)
-                if key in context))
-        return self.cache.setdefault((user, keys),
-            LRUDict(config.getint('cache', 'model')))
+        transaction = Transaction()
+        key = (transaction.user,
+            transaction.context_fingerprint(frozenset(self.cache_keys)))
+        try:
+            return self.cache[key]
+        except KeyError:
+            return self.cache.setdefault(key,
+                LRUDict(config.getint('cache', 'model')))
+
+    def get_model_cache(self, cache, model_name, size_limit):
+        '''
+        Return the record cache of the model from the cache of get_cache
+
+        :param cache: a cache returned by get_cache
+        :param model_name: the model name
+        :param size_limit: the number of records to keep
+        :return: a LRUDict
+        '''
+        from trytond.cache import LRUDict
+        try:
+            return cache[model_name]
+        except KeyError:
+            model_cache = cache[model_name] = LRUDict(size_limit)
+            model_cache.statistics = self.cache_statistics(model_name)
+            return model_cache
+
+    def cache_statistics(self, model_name):
+        '''
+        Return the statistics of the record cache of the model
+
+        :param model_name: the model name
+        :return: a Statistics
+        '''
+        from trytond.cache import Statistics
+        key = (self.database_name, model_name)
+        try:
+            return self._statistics[key]
+        except KeyError:
+            with self._statistics_lock:
+                return self._statistics.setdefault(key, Statistics())
+
+    @classmethod
+    def get_statistics(cls, database_name):
+        '''
+        Return the statistics of the record caches of the database
+
+        :param database_name: the database name
+        :return: a dictionary of statistics values per model name
+        '''
+        with cls._statistics_lock:
+            return dict((model_name, statistics.as_dict())
+                for (dbname, model_name), statistics
+                in cls._statistics.iteritems()
+                if dbname == database_name)
 
     def execute(self, sql, params=None):
         '''
@@ -129,6 +201,15 @@ class CursorInterface(object):
         '''
         raise NotImplementedError
 
+    def notify(self, channel, payload):
+        '''
+        Send a notification on the channel when the cursor is committed
+
+        :param channel: the channel name
+        :param payload: a string
+        '''
+        raise NotImplementedError
+
     def close(self, close=False):
         '''
         Close the cursor
@@ -219,3 +300,28 @@ class CursorInterface(object):
 
         :return: a boolean
         '''
+
+    def has_rowcount(self):
+        '''
+        Return True if the rowcount of UPDATE and DELETE statements is the
+        number of rows matched by the WHERE clause.
+
+        :return: a boolean
+        '''
+
+    def has_recursive_cte(self):
+        '''
+        Return True if database implements recursive common table expressions
+        with WITH RECURSIVE.
+
+        :return: a boolean
+        '''
+
+    def streaming_cursor(self):
+        '''
+        Return a new cursor on the same transaction which fetches the rows
+        from the database incrementally. It must be closed after use.
+
+        :return: a cursor
+        '''
+        raise NotImplementedError
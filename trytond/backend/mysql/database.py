@@ -288,6 +288,10 @@ class Cursor(CursorInterface):
         else:
             return self.cursor.execute(sql)
 
+    def streaming_cursor(self):
+        # MySQL can not execute queries while streaming a result
+        return self._conn.cursor(_Cursor)
+
     def close(self, close=False):
         self.cursor.close()
         self.rollback()
@@ -12,12 +12,15 @@ try:
     from psycopg2.extensions import PYDATE, PYDATETIME, PYTIME
 except ImportError:
     PYDATE, PYDATETIME, PYTIME = None, None, None
+import psycopg2
 from psycopg2 import IntegrityError as DatabaseIntegrityError
 from psycopg2 import OperationalError as DatabaseOperationalError
 import time
 import logging
 import re
 import os
+import select
+from itertools import count
 if os.name == 'posix':
     import pwd
 from decimal import Decimal
@@ -38,7 +41,9 @@ class Database(DatabaseInterface):
     _list_cache = None
     _list_cache_timestamp = None
     _version_cache = {}
+    _dsn = None
     flavor = Flavor(ilike=True)
+    listen_timeout = 5
 
     def __new__(cls, database_name='template1'):
         if database_name in cls._databases:
@@ -63,7 +68,8 @@ class Database(DatabaseInterface):
         password = uri.password and "password=%s" % uri.password or ''
         minconn = config.getint('database', 'minconn', 1)
         maxconn = config.getint('database', 'maxconn', 64)
-        dsn = '%s %s %s %s %s' % (host, port, name, user, password)
+        self._dsn = dsn = '%s %s %s %s %s' % (
+            host, port, name, user, password)
         self._connpool = ThreadedConnectionPool(minconn, maxconn, dsn)
         return self
 
@@ -256,6 +262,43 @@ class Database(DatabaseInterface):
                     'VALUES (%s, now(), %s, %s)',
                     (0, module_id, dependency))
 
+    def has_channel(self):
+        return True
+
+    def listen(self, channel):
+        logger = logging.getLogger('database')
+        if self._connpool is None:
+            self.connect()
+        # The listener stops when the pool is closed or replaced
+        connpool = self._connpool
+        while self._connpool is connpool:
+            # A dedicated connection to not hold one of the pool
+            try:
+                conn = psycopg2.connect(self._dsn)
+            except DatabaseOperationalError:
+                logger.warning('listen on "%s" failed', self.database_name,
+                    exc_info=True)
+                time.sleep(self.listen_timeout)
+                continue
+            try:
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute('LISTEN "%s"' % channel)
+                yield None
+                while self._connpool is connpool:
+                    readable, _, _ = select.select([conn], [], [],
+                        self.listen_timeout)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        yield conn.notifies.pop(0).payload
+            except (DatabaseOperationalError, psycopg2.InterfaceError):
+                logger.warning('listen on "%s" lost', self.database_name,
+                    exc_info=True)
+            finally:
+                conn.close()
+
 
 class _Cursor(PsycopgCursor):
 
@@ -280,6 +323,7 @@ class _Cursor(PsycopgCursor):
 
 
 class Cursor(CursorInterface):
+    _streaming_names = count()
 
     def __init__(self, connpool, conn, database):
         super(Cursor, self).__init__()
@@ -313,6 +357,16 @@ class Cursor(CursorInterface):
         else:
             return self.cursor.execute(sql)
 
+    def notify(self, channel, payload):
+        self.cursor.execute('SELECT pg_notify(%s, %s)', (channel, payload))
+
+    def streaming_cursor(self):
+        # Named cursors are not available outside of transactions
+        if self._conn.isolation_level == ISOLATION_LEVEL_AUTOCOMMIT:
+            return self._conn.cursor(cursor_factory=_Cursor)
+        return self._conn.cursor('trytond_%s' % next(self._streaming_names),
+            cursor_factory=_Cursor)
+
     def close(self, close=False):
         self.cursor.close()
         self.rollback()
@@ -372,6 +426,13 @@ class Cursor(CursorInterface):
         # RETURNING clause is available since PostgreSQL 8.2
         return self._database.get_version(self) >= (8, 2)
 
+    def has_rowcount(self):
+        return True
+
+    def has_recursive_cte(self):
+        # WITH RECURSIVE is available since PostgreSQL 8.4
+        return self._database.get_version(self) >= (8, 4)
+
 register_type(UNICODE)
 if PYDATE:
     register_type(PYDATE)
@@ -401,6 +401,16 @@ class Cursor(CursorInterface):
     def has_constraint(self):
         return False
 
+    def has_rowcount(self):
+        return not _FIX_ROWCOUNT
+
+    def has_recursive_cte(self):
+        # WITH RECURSIVE is available since SQLite 3.8.3
+        return sqlite.sqlite_version_info >= (3, 8, 3)
+
+    def streaming_cursor(self):
+        return self._conn.cursor(_Cursor)
+
 sqlite.register_converter('NUMERIC', lambda val: Decimal(val))
 if sys.version_info[0] == 2:
     sqlite.register_adapter(Decimal, lambda val: buffer(str(val)))
@@ -1,14 +1,42 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-from threading import Lock
+import os
+import errno
+import json
+import logging
+import tempfile
+import time
+import stat
+import cPickle as pickle
+from threading import Lock, Thread, Event, local
 from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from sql import Table
 from sql.functions import Now
 
+from trytond import backend
+from trytond.config import config
 from trytond.transaction import Transaction
 
-__all__ = ['Cache', 'LRUDict']
+__all__ = ['Cache', 'LRUDict', 'Statistics', 'LocalChannel',
+    'DatabaseChannel', 'MemoryStore', 'SharedStore']
+
+logger = logging.getLogger(__name__)
+_missing = object()
+
+
+def _check_private(path, stat_=None):
+    'Raise IOError if path is not owned by and restricted to the process user'
+    if stat_ is None:
+        stat_ = os.lstat(path)
+    if stat_.st_uid != os.getuid() or stat_.st_mode & 0077:
+        raise IOError('"%s" is not private to the user' % path)
 
 
 def freeze(o):
@@ -23,57 +51,149 @@ def freeze(o):
 class Cache(object):
     """
     A key value LRU cache with size limit.
+    The keys depend on the user and on the context if context is True or
+    only on the context keys if context is a list of keys.
+    The store is the configured one unless it is named by store.
     """
     _cache_instance = []
     _resets = {}
     _resets_lock = Lock()
+    _channels = {}
+    _channels_lock = Lock()
+    _statistics_logged = {}
 
-    def __init__(self, name, size_limit=1024, context=True):
+    def __init__(self, name, size_limit=1024, context=True, store=None):
         self.size_limit = size_limit
         self.context = context
-        self._cache = {}
+        self._store_name = store
+        if isinstance(context, bool):
+            self._context_keys = None
+        else:
+            self._context_keys = frozenset(context)
         self._cache_instance.append(self)
         self._name = name
         self._timestamp = None
         self._lock = Lock()
+        self._store = None
+        self._statistics = {}
+        self._cleared = {}
+
+    @property
+    def store(self):
+        'The store of the entries selected by the configuration'
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    Store = STORES[self._store_name
+                        or config.get('cache', 'store', 'memory')]
+                    self._store = Store(self._name, self.size_limit,
+                        self.statistics)
+        return self._store
+
+    def statistics(self, dbname):
+        'Return the statistics of the cache for the database'
+        try:
+            return self._statistics[dbname]
+        except KeyError:
+            return self._statistics.setdefault(dbname, Statistics())
 
     def _key(self, key):
         if self.context:
-            return (key, Transaction().user, freeze(Transaction().context))
+            transaction = Transaction()
+            return (key, transaction.user,
+                transaction.context_fingerprint(self._context_keys))
         return key
 
     def get(self, key, default=None):
-        cursor = Transaction().cursor
-        key = self._key(key)
-        with self._lock:
-            cache = self._cache.setdefault(cursor.dbname,
-                LRUDict(self.size_limit))
-            try:
-                result = cache[key] = cache.pop(key)
-                return result
-            except (KeyError, TypeError):
-                return default
+        dbname = Transaction().cursor.dbname
+        result = self.store.get(dbname, self._key(key), _missing)
+        if result is _missing:
+            self.statistics(dbname).miss += 1
+            return default
+        self.statistics(dbname).hit += 1
+        return result
 
     def set(self, key, value):
-        cursor = Transaction().cursor
-        key = self._key(key)
-        with self._lock:
-            cache = self._cache.setdefault(cursor.dbname,
-                LRUDict(self.size_limit))
-            try:
-                cache[key] = value
-            except TypeError:
-                pass
+        dbname = Transaction().cursor.dbname
+        self.statistics(dbname).set += 1
+        self.store.set(dbname, self._key(key), value)
         return value
 
     def clear(self):
         cursor = Transaction().cursor
         Cache.reset(cursor.dbname, self._name)
-        with self._lock:
-            self._cache[cursor.dbname] = LRUDict(self.size_limit)
+        # The other processes clear all the caches with the same name
+        Cache.clean_names(cursor.dbname, [self._name])
+
+    def _clear(self, dbname):
+        self._cleared[dbname] = time.time()
+        self.statistics(dbname).clear += 1
+        self.store.clear(dbname)
+
+    def cleared_since(self, timestamp):
+        'Return True if the cache was cleared in this process since timestamp'
+        dbname = Transaction().cursor.dbname
+        return self._cleared.get(dbname, 0) >= timestamp
+
+    @staticmethod
+    def get_statistics(dbname):
+        '''
+        Return a dictionary with the statistics and the size of the caches
+        of the database per name.
+        '''
+        result = {}
+        for inst in Cache._cache_instance:
+            values = result.setdefault(inst._name, dict.fromkeys(
+                    Statistics.__slots__ + ('size', 'size_limit'), 0))
+            for name, value in inst.statistics(dbname).as_dict().iteritems():
+                values[name] += value
+            values['size'] += inst.store.size(dbname)
+            values['size_limit'] += inst.size_limit
+        return result
+
+    @staticmethod
+    def log_statistics(dbname):
+        'Log the statistics of the caches if the configured delay is elapsed'
+        delay = config.getint('cache', 'log_statistics')
+        if not delay:
+            return
+        now = time.time()
+        if Cache._statistics_logged.setdefault(dbname, now) + delay > now:
+            return
+        Cache._statistics_logged[dbname] = now
+        Cursor = backend.get('Cursor')
+        for kind, statistics in (
+                ('cache', Cache.get_statistics(dbname)),
+                ('record', Cursor.get_statistics(dbname))):
+            for name, values in sorted(statistics.iteritems()):
+                logger.info('%s "%s" on "%s": %s', kind, name, dbname,
+                    ', '.join('%s=%s' % v for v in sorted(values.iteritems())))
+
+    @staticmethod
+    def channel(dbname):
+        '''
+        Return the invalidation channel for the database or None if the
+        caches must be cleaned by polling the ir_cache table.
+        '''
+        with Cache._channels_lock:
+            if dbname not in Cache._channels:
+                name = config.get('cache', 'channel')
+                if name is None:
+                    Database = backend.get('Database')
+                    if Database(dbname).has_channel():
+                        name = 'database'
+                Channel = CHANNELS.get(name)
+                Cache._channels[dbname] = Channel and Channel(dbname)
+            return Cache._channels[dbname]
 
     @staticmethod
     def clean(dbname):
+        channel = Cache.channel(dbname)
+        if channel:
+            if channel.listening:
+                return
+            # Start listening before polling to not miss any reset
+            channel.listen()
         with Transaction().new_cursor():
             cursor = Transaction().cursor
             table = Table('ir_cache')
@@ -84,10 +204,18 @@ class Cache(object):
         for inst in Cache._cache_instance:
             if inst._name in timestamps:
                 with inst._lock:
-                    if (not inst._timestamp
-                            or timestamps[inst._name] > inst._timestamp):
-                        inst._timestamp = timestamps[inst._name]
-                        inst._cache[dbname] = LRUDict(inst.size_limit)
+                    if (inst._timestamp
+                            and timestamps[inst._name] <= inst._timestamp):
+                        continue
+                    inst._timestamp = timestamps[inst._name]
+                inst._clear(dbname)
+
+    @staticmethod
+    def clean_names(dbname, names):
+        'Clear the caches named in names for the database'
+        for inst in Cache._cache_instance:
+            if inst._name in names:
+                inst._clear(dbname)
 
     @staticmethod
     def reset(dbname, name):
@@ -96,32 +224,424 @@ class Cache(object):
             Cache._resets[dbname].add(name)
 
     @staticmethod
-    def resets(dbname):
-        with Transaction().new_cursor():
-            cursor = Transaction().cursor
-            table = Table('ir_cache')
-            with Cache._resets_lock:
-                Cache._resets.setdefault(dbname, set())
-                for name in Cache._resets[dbname]:
-                    cursor.execute(*table.select(table.name,
-                            where=table.name == name))
-                    if cursor.fetchone():
-                        # It would be better to insert only
-                        cursor.execute(*table.update([table.timestamp],
-                                [Now()], where=table.name == name))
-                    else:
-                        cursor.execute(*table.insert(
-                                [table.timestamp, table.name],
-                                [[Now(), name]]))
-                Cache._resets[dbname].clear()
+    def resets(dbname, cursor=None):
+        '''
+        Write the pending resets of the database.
+        If cursor is set, it is used and committed instead of a new cursor so
+        it must not have pending changes to rollback.
+        '''
+        with Cache._resets_lock:
+            if not Cache._resets.get(dbname):
+                return
+        if cursor is None:
+            with Transaction().new_cursor():
+                Cache._write_resets(dbname, Transaction().cursor)
+        else:
+            Cache._write_resets(dbname, cursor)
+
+    @staticmethod
+    def _write_resets(dbname, cursor):
+        channel = Cache.channel(dbname)
+        table = Table('ir_cache')
+        with Cache._resets_lock:
+            names = Cache._resets.setdefault(dbname, set())
+            if not names:
+                return
+            cursor.execute(*table.update([table.timestamp], [Now()],
+                    where=table.name.in_(list(names))))
+            # Insert only the names never reset before
+            if cursor.rowcount < len(names):
+                cursor.execute(*table.select(table.name,
+                        where=table.name.in_(list(names))))
+                missing = names.difference(n for n, in cursor.fetchall())
+                if missing:
+                    cursor.execute(*table.insert(
+                            [table.timestamp, table.name],
+                            [[Now(), n] for n in sorted(missing)]))
+            if channel:
+                channel.notify(cursor, names)
+            names.clear()
             cursor.commit()
 
 
+class LocalChannel(object):
+    '''
+    In-process invalidation channel
+
+    The resets are applied directly to the caches of the current process, so
+    it must be used only when a single process accesses the database.
+    '''
+    listening = True
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+
+    def listen(self):
+        pass
+
+    def notify(self, cursor, names):
+        Cache.clean_names(self.dbname, names)
+
+
+class DatabaseChannel(object):
+    '''
+    Invalidation channel using the notifications of the database
+
+    A listener thread per database clears the caches when the resets are
+    committed by any process.
+    '''
+    name = 'trytond_cache'
+    timeout = 5
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self._thread = None
+        self._ready = Event()
+        self._lock = Lock()
+
+    @property
+    def listening(self):
+        return (self._thread is not None and self._thread.is_alive()
+            and self._ready.is_set())
+
+    def listen(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready = ready = Event()
+                self._thread = Thread(target=self._listen, args=(ready,),
+                    name='%s %s' % (self.name, self.dbname))
+                self._thread.daemon = True
+                self._thread.start()
+            ready = self._ready
+        ready.wait(self.timeout)
+
+    def _listen(self, ready):
+        Database = backend.get('Database')
+        database = Database(self.dbname)
+        logger.info('listen channel "%s" on "%s"', self.name, self.dbname)
+        try:
+            for payload in database.listen(self.name):
+                if payload:
+                    Cache.clean_names(self.dbname, json.loads(payload))
+                elif ready.is_set():
+                    # The resets sent while reconnecting are lost
+                    Cache.clean_names(self.dbname,
+                        [inst._name for inst in Cache._cache_instance])
+                ready.set()
+        except Exception:
+            logger.warning('listener on "%s" stopped', self.dbname,
+                exc_info=True)
+        finally:
+            ready.set()
+
+    def notify(self, cursor, names):
+        cursor.notify(self.name, json.dumps(sorted(names)))
+
+CHANNELS = {
+    'local': LocalChannel,
+    'database': DatabaseChannel,
+    }
+
+
+class MemoryStore(object):
+    '''
+    Store the entries of a cache in the memory of the process
+    '''
+
+    def __init__(self, name, size_limit, statistics=None):
+        self.name = name
+        self.size_limit = size_limit
+        self.statistics = statistics
+        self._cache = {}
+        self._lock = Lock()
+
+    def _new(self, dbname):
+        cache = self._cache[dbname] = LRUDict(self.size_limit)
+        if self.statistics:
+            cache.statistics = self.statistics(dbname)
+        return cache
+
+    def get(self, dbname, key, default=None):
+        with self._lock:
+            cache = self._cache.get(dbname)
+            try:
+                result = cache[key] = cache.pop(key)
+                return result
+            except (AttributeError, KeyError, TypeError):
+                return default
+
+    def set(self, dbname, key, value):
+        with self._lock:
+            cache = self._cache.get(dbname)
+            if cache is None:
+                cache = self._new(dbname)
+            try:
+                cache[key] = value
+            except TypeError:
+                pass
+
+    def clear(self, dbname):
+        with self._lock:
+            self._new(dbname)
+
+    def size(self, dbname):
+        return len(self._cache.get(dbname, ()))
+
+
+class SharedStore(MemoryStore):
+    '''
+    Store the entries of a cache in the memory of the process and share them
+    with the other processes of the host through a local socket server.
+
+    The first process which locks the socket runs the server, the others
+    connect to it. The entries which can not be pickled stay in the process.
+    The socket, its lock and the key authenticating the connections must be
+    private to the user.
+    '''
+    retry = 10
+    _local = local()
+    _retry_time = 0
+    _server = None
+    _server_lock = Lock()
+
+    @staticmethod
+    def address():
+        address = config.get('cache', 'socket')
+        if not address:
+            directory = os.path.join(tempfile.gettempdir(),
+                'trytond-cache-%s' % os.getuid())
+            try:
+                os.mkdir(directory, 0700)
+            except OSError, exception:
+                if exception.errno != errno.EEXIST:
+                    raise
+            _check_private(directory)
+            address = os.path.join(directory, 'socket')
+        return address
+
+    @staticmethod
+    def authkey(address):
+        'Return the key shared by the processes to authenticate'
+        path = address + '.key'
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+        except OSError, exception:
+            if exception.errno != errno.EEXIST:
+                raise
+        else:
+            with os.fdopen(fd, 'wb') as key_file:
+                key_file.write(os.urandom(32))
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+        with os.fdopen(fd, 'rb') as key_file:
+            _check_private(path, os.fstat(fd))
+            authkey = key_file.read()
+        if not authkey:
+            raise IOError('"%s" is empty' % path)
+        return authkey
+
+    @classmethod
+    def serve(cls):
+        'Run the server if no other process of the host runs it'
+        address = cls.address()
+        with cls._server_lock:
+            if cls._server is not None and cls._server.is_alive():
+                return
+            fd = os.open(address + '.lock',
+                os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0600)
+            lock_file = os.fdopen(fd, 'a')
+            try:
+                _check_private(address + '.lock', os.fstat(fd))
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock_file.close()
+                return
+            if os.path.lexists(address):
+                os.remove(address)
+            cls._server = SharedCacheServer(address, lock_file,
+                cls.authkey(address))
+            cls._server.start()
+
+    @classmethod
+    def stop(cls):
+        'Stop the server run by the process'
+        with cls._server_lock:
+            if cls._server is not None:
+                cls._server.close()
+                cls._server = None
+
+    @classmethod
+    def _connection(cls):
+        conn = getattr(cls._local, 'conn', None)
+        if conn is None and cls._retry_time <= time.time():
+            try:
+                cls.serve()
+                address = cls.address()
+                stat_ = os.lstat(address)
+                if not stat.S_ISSOCK(stat_.st_mode):
+                    raise IOError('"%s" is not a socket' % address)
+                _check_private(address, stat_)
+                conn = cls._local.conn = Client(address, 'AF_UNIX',
+                    authkey=cls.authkey(address))
+            except Exception:
+                logger.warning('unable to connect to shared cache',
+                    exc_info=True)
+                cls._retry_time = time.time() + cls.retry
+        return conn
+
+    @classmethod
+    def _call(cls, *request):
+        try:
+            request = pickle.dumps(request, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        conn = cls._connection()
+        if conn is None:
+            return
+        try:
+            conn.send_bytes(request)
+            return pickle.loads(conn.recv_bytes())
+        except Exception:
+            cls._local.conn = None
+            conn.close()
+
+    def get(self, dbname, key, default=None):
+        result = super(SharedStore, self).get(dbname, key, _missing)
+        if result is not _missing:
+            return result
+        data = self._call('get', dbname, self.name, self.size_limit, key)
+        if data is None:
+            return default
+        try:
+            result = pickle.loads(data)
+        except Exception:
+            return default
+        super(SharedStore, self).set(dbname, key, result)
+        return result
+
+    def set(self, dbname, key, value):
+        super(SharedStore, self).set(dbname, key, value)
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self._call('set', dbname, self.name, self.size_limit, key, data)
+
+    def clear(self, dbname):
+        super(SharedStore, self).clear(dbname)
+        self._call('clear', dbname, self.name, self.size_limit)
+
+
+class SharedCacheServer(Thread):
+    '''
+    Serve the pickled entries of the shared caches.
+    Each cache is a LRUDict limited by the size of the cache.
+    As the names are not unique, the caches are also keyed by their size.
+    '''
+
+    def __init__(self, address, lock_file, authkey):
+        super(SharedCacheServer, self).__init__(name='trytond shared cache')
+        self.daemon = True
+        # The socket must never be accessible by the other users
+        umask = os.umask(0077)
+        try:
+            self.listener = Listener(address, 'AF_UNIX', authkey=authkey)
+        finally:
+            os.umask(umask)
+        self.lock_file = lock_file
+        self._caches = {}
+        self._lock = Lock()
+
+    def run(self):
+        logger.info('serve shared cache on "%s"', self.listener.address)
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except (AuthenticationError, EOFError, IOError):
+                    if self.lock_file.closed:
+                        raise
+                    logger.warning('shared cache connection refused',
+                        exc_info=True)
+                    continue
+                thread = Thread(target=self.handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        except Exception:
+            if not self.lock_file.closed:
+                logger.warning('shared cache server stopped', exc_info=True)
+        finally:
+            self.close()
+
+    def close(self):
+        self.lock_file.close()
+        self.listener.close()
+
+    def handle(self, conn):
+        try:
+            while True:
+                request = pickle.loads(conn.recv_bytes())
+                conn.send_bytes(pickle.dumps(self.process(*request),
+                        pickle.HIGHEST_PROTOCOL))
+        except (EOFError, IOError):
+            pass
+        except Exception:
+            logger.warning('shared cache request failed', exc_info=True)
+        finally:
+            conn.close()
+
+    def process(self, method, dbname, name, size_limit, *args):
+        cache_key = (dbname, name, size_limit)
+        with self._lock:
+            if method == 'get':
+                key, = args
+                cache = self._caches.get(cache_key)
+                try:
+                    data = cache[key] = cache.pop(key)
+                    return data
+                except (AttributeError, KeyError, TypeError):
+                    return
+            elif method == 'set':
+                key, data = args
+                cache = self._caches.get(cache_key)
+                if cache is None:
+                    cache = self._caches[cache_key] = LRUDict(size_limit)
+                try:
+                    cache[key] = data
+                except TypeError:
+                    pass
+            elif method == 'clear':
+                self._caches.pop(cache_key, None)
+
+STORES = {
+    'memory': MemoryStore,
+    }
+if fcntl:
+    STORES['shared'] = SharedStore
+
+
+class Statistics(object):
+    """
+    Counters of the usage of a cache.
+    They are not locked so concurrent updates may be missed.
+    """
+    __slots__ = ('hit', 'miss', 'set', 'eviction', 'clear')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
 class LRUDict(OrderedDict):
     """
     Dictionary with a size limit.
     If size limit is reached, it will remove the first added items.
+    The removals are counted on statistics if it is set.
     """
+    statistics = None
+
     def __init__(self, size_limit, *args, **kwargs):
         assert size_limit > 0
         self.size_limit = size_limit
@@ -144,3 +664,5 @@ class LRUDict(OrderedDict):
     def _check_size_limit(self):
         while len(self) > self.size_limit:
             self.popitem(last=False)
+            if self.statistics is not None:
+                self.statistics.eviction += 1
@@ -55,6 +55,7 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.set('cache', 'model', 200)
         self.set('cache', 'record', 2000)
         self.set('cache', 'field', 100)
+        self.set('cache', 'translation_preload', 'False')
         self.add_section('ssl')
         self.add_section('email')
         self.set('email', 'uri', 'smtp://localhost:25')
@@ -594,7 +594,7 @@ class ActionReport(ActionMixin, ModelSQL, ModelView):
         contents = {}
         converter = buffer
         default = None
-        format_ = Transaction().context.pop('%s.%s'
+        format_ = Transaction().context.get('%s.%s'
             % (cls.__name__, name), '')
         if format_ == 'size':
             converter = len
@@ -626,7 +626,7 @@ class ActionReport(ActionMixin, ModelSQL, ModelView):
         contents = {}
         converter = buffer
         default = None
-        format_ = Transaction().context.pop('%s.%s'
+        format_ = Transaction().context.get('%s.%s'
             % (cls.__name__, name), '')
         if format_ == 'size':
             converter = len
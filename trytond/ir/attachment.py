@@ -110,7 +110,7 @@ class Attachment(ModelSQL, ModelView):
 
     def get_data(self, name):
         db_name = Transaction().cursor.dbname
-        format_ = Transaction().context.pop('%s.%s'
+        format_ = Transaction().context.get('%s.%s'
             % (self.__name__, name), '')
         value = None
         if name == 'data_size' or format_ == 'size':
@@ -11,7 +11,8 @@ class Configuration(ModelSingleton, ModelSQL):
     'Configuration'
     __name__ = 'ir.configuration'
     language = fields.Char('language')
-    _get_language_cache = Cache('ir_configuration.get_language')
+    _get_language_cache = Cache('ir_configuration.get_language',
+        context=False)
 
     @staticmethod
     def default_language():
@@ -44,7 +44,7 @@ class Lang(ModelSQL, ModelView):
     decimal_point = fields.Char('Decimal Separator', required=True)
     thousands_sep = fields.Char('Thousands Separator')
 
-    _lang_cache = Cache('ir.lang')
+    _lang_cache = Cache('ir.lang', context=['active_test'])
 
     @classmethod
     def __setup__(cls):
@@ -1,6 +1,8 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-from ..model import ModelView, ModelSQL, fields
+import copy
+
+from ..model import ModelView, ModelSQL, ModelStorage, fields
 from ..tools import safe_eval
 from ..transaction import Transaction
 from ..cache import Cache
@@ -97,13 +99,22 @@ class Rule(ModelSQL, ModelView):
        required=True, ondelete="CASCADE")
     domain = fields.Char('Domain', required=True,
         help='Domain is evaluated with "user" as the current user')
+    user_fields = fields.Char('User Fields',
+        help='Comma separated list of the fields of "user" used by the '
+        'domain.\nIf empty, the domain is cached per user when it uses '
+        '"user".')
     _domain_get_cache = Cache('ir_rule.domain_get', context=False)
+    # The keys of the users are cleared with the domains but kept apart to
+    # not evict them
+    _domain_get_user_cache = Cache('ir_rule.domain_get', context=False,
+        store='memory')
 
     @classmethod
     def __setup__(cls):
         super(Rule, cls).__setup__()
         cls._error_messages.update({
                 'invalid_domain': 'Invalid domain in rule "%s".',
+                'invalid_user_fields': 'Invalid user fields in rule "%s".',
                 })
 
     @classmethod
@@ -121,6 +132,7 @@ class Rule(ModelSQL, ModelView):
     def validate(cls, rules):
         super(Rule, cls).validate(rules)
         cls.check_domain(rules)
+        cls.check_user_fields(rules)
 
     @classmethod
     def check_domain(cls, rules):
@@ -138,6 +150,46 @@ class Rule(ModelSQL, ModelView):
                 except Exception:
                     cls.raise_user_error('invalid_domain', (rule.rec_name,))
 
+    @classmethod
+    def check_user_fields(cls, rules):
+        User = Pool().get('res.user')
+        for rule in rules:
+            for name in rule.get_user_fields():
+                if name not in User._fields:
+                    cls.raise_user_error('invalid_user_fields',
+                        (rule.rec_name,))
+
+    def get_user_fields(self):
+        'Return the names of the user fields used by the domain'
+        return self._user_fields(self.domain, self.user_fields)
+
+    @classmethod
+    def _user_fields(cls, domain, user_fields):
+        # Any name of the evaluation context may depend on the user
+        context_names = set(cls._get_context())
+
+        def used_names(code):
+            names = set(code.co_names) & context_names
+            for const in code.co_consts:
+                if isinstance(const, type(code)):
+                    names |= used_names(const)
+            return names
+        try:
+            names = used_names(compile(domain, '<string>', 'eval'))
+        except SyntaxError:
+            names = set()
+
+        result = set()
+        if user_fields:
+            result.update(n.strip() for n in user_fields.split(',')
+                if n.strip())
+        elif 'user' in names:
+            result.add('id')
+        # The declared fields cover only "user"
+        if names - set(['user']):
+            result.add('id')
+        return result
+
     @staticmethod
     def _get_context():
         User = Pool().get('res.user')
@@ -150,10 +202,81 @@ class Rule(ModelSQL, ModelView):
 
     @staticmethod
     def _get_cache_key():
-        return (Transaction().user,)
+        return ()
+
+    @classmethod
+    def _get_user_key(cls, model_name, mode):
+        '''
+        Return the key of the rules of the model for the user: its groups,
+        its rule groups and the values of the user fields used by the rules.
+        '''
+        pool = Pool()
+        User = pool.get('res.user')
+        RuleGroup = pool.get('ir.rule.group')
+        Model = pool.get('ir.model')
+        RuleGroup_User = pool.get('ir.rule.group-res.user')
+        User_Group = pool.get('res.user-res.group')
+
+        cursor = Transaction().cursor
+        rule_table = cls.__table__()
+        rule_group = RuleGroup.__table__()
+        rule_group_user = RuleGroup_User.__table__()
+        user_group = User_Group.__table__()
+        model = Model.__table__()
+        user_id = Transaction().user
+
+        groups = cls._domain_get_user_cache.get(user_id)
+        if groups is None:
+            cursor.execute(*user_group.select(user_group.group,
+                    where=user_group.user == user_id))
+            groups = tuple(sorted(g for g, in cursor.fetchall()))
+            cls._domain_get_user_cache.set(user_id, groups)
+
+        cursor.execute(*rule_group_user.join(rule_group,
+                condition=rule_group_user.rule_group == rule_group.id
+                ).join(model,
+                condition=rule_group.model == model.id
+                ).select(rule_group_user.rule_group,
+                where=(rule_group_user.user == user_id)
+                & (model.model == model_name)))
+        rule_groups = tuple(sorted(r for r, in cursor.fetchall()))
+
+        cursor.execute(*rule_table.join(rule_group,
+                condition=rule_group.id == rule_table.rule_group
+                ).join(model,
+                condition=rule_group.model == model.id
+                ).select(rule_table.domain, rule_table.user_fields,
+                where=(model.model == model_name)
+                & getattr(rule_group, 'perm_%s' % mode)))
+        names = set()
+        for domain, user_fields in cursor.fetchall():
+            names.update(cls._user_fields(domain, user_fields))
+
+        values = []
+        if names:
+            # Use root user without context to prevent recursion
+            with Transaction().set_user(0), \
+                    Transaction().set_context(user=0):
+                user = User(user_id)
+                for name in sorted(names):
+                    values.append(
+                        (name, cls._user_value(getattr(user, name))))
+        return (groups, rule_groups, tuple(values))
+
+    @classmethod
+    def _user_value(cls, value):
+        if isinstance(value, ModelStorage):
+            return value.id
+        elif isinstance(value, (list, tuple)):
+            return tuple(sorted(cls._user_value(v) for v in value))
+        return value
 
     @classmethod
-    def domain_get(cls, model_name, mode='read'):
+    def domain_get(cls, model_name, mode='read', table=None):
+        '''
+        Return the query of the ids allowed by the rules or, if table is set,
+        the condition on the table.
+        '''
         assert mode in ['read', 'write', 'create', 'delete'], \
             'Invalid domain mode for security'
 
@@ -162,12 +285,45 @@ class Rule(ModelSQL, ModelView):
             if not Transaction().context.get('user'):
                 return
             with Transaction().set_user(Transaction().context['user']):
-                return cls.domain_get(model_name, mode=mode)
-
-        key = (model_name, mode) + cls._get_cache_key()
+                return cls.domain_get(model_name, mode=mode, table=table)
+
+        # The domains are shared by the users with the same key
+        user_key = (model_name, mode, Transaction().user)
+        key = cls._domain_get_user_cache.get(user_key)
+        if key is None:
+            key = (model_name, mode) + cls._get_user_key(model_name, mode)
+            cls._domain_get_user_cache.set(user_key, key)
+        key += cls._get_cache_key()
         domain = cls._domain_get_cache.get(key, False)
-        if domain is not False:
-            return domain
+        if domain is False:
+            domain = cls._domain_get(model_name, mode)
+            cls._domain_get_cache.set(key, domain)
+        if domain is None:
+            return
+        if table is None:
+            return domain[1]
+        return cls._domain_condition(model_name, domain, table)
+
+    @classmethod
+    def _domain_condition(cls, model_name, domain, table):
+        '''
+        Return the cached expression rebound to the table or the query as
+        fallback when it needs other tables.
+        '''
+        Model = Pool().get(model_name)
+        _, query, compiled_table, expression = domain
+        if (expression is not None
+                and not (Model._history
+                    and Transaction().context.get('_datetime'))):
+            return copy.deepcopy(expression, {id(compiled_table): table})
+        return table.id.in_(query)
+
+    @classmethod
+    def _domain_get(cls, model_name, mode):
+        '''
+        Return the clause, the query, the table and the expression on it
+        (None if it needs other tables) of the rules of the user or None
+        '''
 
         pool = Pool()
         RuleGroup = pool.get('ir.rule.group')
@@ -206,7 +362,6 @@ class Rule(ModelSQL, ModelView):
                     )))
         ids = [x[0] for x in cursor.fetchall()]
         if not ids:
-            cls._domain_get_cache.set(key, None)
             return
         obj = pool.get(model_name)
         clause = {}
@@ -256,9 +411,14 @@ class Rule(ModelSQL, ModelView):
         with Transaction().set_user(0), \
                 Transaction().set_context(active_test=False, user=0):
             query = obj.search(clause, order=[], query=True)
-
-        cls._domain_get_cache.set(key, query)
-        return query
+            table, expression = obj.__table__(), None
+            if not obj.table_query():
+                with Transaction().set_context(_datetime=None):
+                    tables, expression = obj.search_domain(clause,
+                        tables={None: (table, None)})
+                if len(tables) != 1:
+                    expression = None
+        return clause, query, table, expression
 
     @classmethod
     def delete(cls, rules):
@@ -14,7 +14,7 @@ from lxml import etree
 from itertools import izip
 
 from sql import Column, Null
-from sql.functions import Substring, Position
+from sql.functions import Substring, Position, Now
 from sql.conditionals import Case
 from sql.operators import Or, And
 from sql.aggregate import Max
@@ -75,7 +75,13 @@ class Translation(ModelSQL, ModelView):
     overriding_module = fields.Char('Overriding Module', readonly=True)
     _translation_cache = Cache('ir.translation', size_limit=10240,
         context=False)
-    _get_language_cache = Cache('ir.translation')
+    _get_language_cache = Cache('ir.translation',
+        context=['language', 'active_test'])
+    # The snapshots are too big to be sent to a shared store
+    _translation_preload_cache = Cache('ir.translation', size_limit=64,
+        context=False, store='memory')
+    _preload_types = ('field', 'help', 'selection', 'model', 'error', 'view',
+        'wizard_button')
 
     @classmethod
     def __setup__(cls):
@@ -526,60 +532,103 @@ class Translation(ModelSQL, ModelView):
                     cls.create(to_create)
             return
 
-        Model = pool.get(model_name)
-        with Transaction().set_context(language=Config.get_language()):
-            records = Model.browse(ids)
+        # The sources are the values stored in the column of the model
+        model_table = pool.get(model_name).__table__()
+        cursor.execute(*model_table.select(model_table.id,
+                Column(model_table, field_name),
+                where=reduce_ids(model_table.id, ids)))
+        sources = dict(cursor.fetchall())
 
+        transaction = Transaction()
+        table = cls.__table__()
+        user = transaction.user
+        where = ((table.lang == lang) & (table.type == ttype)
+            & (table.name == name) & reduce_ids(table.res_id, ids))
+        cursor.execute(*table.select(table.id, table.res_id, where=where))
         translations = {}
-        for translation in cls.search([
-                    ('lang', '=', lang),
-                    ('type', '=', ttype),
-                    ('name', '=', name),
-                    ('res_id', 'in', ids),
-                    ]):
-            translations[translation.res_id] = translation
-
-        other_translations = {}
-        if (lang == Config.get_language()
-                and Transaction().context.get('fuzzy_translation', True)):
-            for translation in cls.search([
-                        ('lang', '!=', lang),
-                        ('type', '=', ttype),
-                        ('name', '=', name),
-                        ('res_id', 'in', ids),
-                        ]):
-                other_translations.setdefault(translation.res_id, []
-                    ).append(translation)
+        for translation_id, res_id in cursor.fetchall():
+            translations.setdefault(res_id, []).append(translation_id)
 
+        # Update at once the translations with the same value and source
+        to_write = {}
         to_create = []
-        for record, value in izip(records, values):
-            translation = translations.get(record.id)
-            if not translation:
-                to_create.append({
-                        'name': name,
-                        'lang': lang,
-                        'type': ttype,
-                        'res_id': record.id,
-                        'value': value,
-                        'src': getattr(record, field_name),
-                        'fuzzy': False,
-                        })
+        for id_, value in izip(ids, values):
+            if id_ in translations:
+                to_write.setdefault((value, sources[id_]), []).extend(
+                    translations[id_])
             else:
-                with Transaction().set_context(_check_access=False):
-                    cls.write([translation], {
-                        'value': value,
-                        'src': getattr(record, field_name),
-                        'fuzzy': False,
-                        })
-                    other_langs = other_translations.get(record.id)
-                    if other_langs:
-                        cls.write(other_langs, {
-                                'src': getattr(record, field_name),
-                                'fuzzy': True,
-                                })
+                to_create.append((id_, value))
+        for (value, src), translation_ids in to_write.iteritems():
+            cursor.execute(*table.update([
+                        table.value, table.src, table.src_md5, table.fuzzy,
+                        table.write_uid, table.write_date,
+                        ], [
+                        value, src, cls.get_src_md5(src), False,
+                        user, Now(),
+                        ], where=reduce_ids(table.id, translation_ids)))
+
         if to_create:
-            with Transaction().set_context(_check_access=False):
-                cls.create(to_create)
+            # Use the module and source of the original translation
+            originals = {}
+            if not transaction.context.get('module'):
+                cursor.execute(*table.select(
+                        table.res_id, table.module, table.src,
+                        where=(table.lang == 'en_US')
+                        & (table.type == ttype) & (table.name == name)
+                        & reduce_ids(table.res_id,
+                            [i for i, _ in to_create])))
+                for res_id, module, src in cursor.fetchall():
+                    originals[res_id] = (module, src)
+            vlist = []
+            for id_, value in to_create:
+                module, src = originals.get(id_,
+                    (transaction.context.get('module'), sources[id_]))
+                vlist.append([name, lang, ttype, id_, value, src,
+                        cls.get_src_md5(src), False, module,
+                        user, Now()])
+            cursor.execute(*table.insert([
+                        table.name, table.lang, table.type, table.res_id,
+                        table.value, table.src, table.src_md5, table.fuzzy,
+                        table.module, table.create_uid, table.create_date,
+                        ], vlist))
+
+        # Flag as fuzzy the other languages of the modified sources
+        if (to_write and lang == Config.get_language()
+                and transaction.context.get('fuzzy_translation', True)):
+            sources_ids = {}
+            for id_ in ids:
+                if id_ in translations:
+                    sources_ids.setdefault(sources[id_], []).append(id_)
+            for src, res_ids in sources_ids.iteritems():
+                cursor.execute(*table.update([
+                            table.src, table.src_md5, table.fuzzy,
+                            table.write_uid, table.write_date,
+                            ], [
+                            src, cls.get_src_md5(src), True,
+                            user, Now(),
+                            ], where=(table.lang != lang)
+                        & (table.type == ttype) & (table.name == name)
+                        & reduce_ids(table.res_id, res_ids)))
+
+        transaction.counter += 1
+        for cache in cursor.cache.itervalues():
+            cache.pop(cls.__name__, None)
+        cls._translation_cache.clear()
+        ModelView._fields_view_get_cache.clear()
+        if ttype == 'model':
+            cls._clear_model_record_caches([name])
+
+    @classmethod
+    def _clear_model_record_caches(cls, names):
+        "Clear the record caches of the models of the translation names"
+        pool = Pool()
+        for model_name in set(n.split(',', 1)[0] for n in names if n):
+            try:
+                Model = pool.get(model_name)
+            except KeyError:
+                continue
+            if issubclass(Model, ModelSQL):
+                Model._clear_record_cache()
 
     @classmethod
     def delete_ids(cls, model, ttype, ids):
@@ -594,6 +643,37 @@ class Translation(ModelSQL, ModelView):
         with Transaction().set_context(_check_access=False):
             cls.delete(translations)
 
+    @classmethod
+    def get_preload(cls, lang):
+        '''
+        Return the translations without resource of the language as a
+        dictionary with (type, name, source) as key or None if the preload is
+        disabled.
+        The translations with a source are also under a None source.
+        '''
+        if (not config.getboolean('cache', 'translation_preload')
+                # Don't store the modifications of the transaction
+                or Transaction().counter):
+            return
+        snapshot = cls._translation_preload_cache.get(lang)
+        if snapshot is None:
+            cursor = Transaction().cursor
+            table = cls.__table__()
+            cursor.execute(*table.select(
+                    table.type, table.name, table.src, table.value,
+                    where=(table.lang == lang)
+                    & table.type.in_(list(cls._preload_types))
+                    & (table.value != '')
+                    & (table.value != Null)
+                    & (table.fuzzy == False)
+                    & (table.res_id == -1)))
+            snapshot = {}
+            for ttype, name, source, value in cursor.fetchall():
+                snapshot[(ttype, name, source)] = value
+                snapshot.setdefault((ttype, name, None), value)
+            cls._translation_preload_cache.set(lang, snapshot)
+        return snapshot
+
     @classmethod
     def get_source(cls, name, ttype, lang, source=None):
         "Return translation for source"
@@ -602,6 +682,10 @@ class Translation(ModelSQL, ModelView):
         lang = unicode(lang)
         if source is not None:
             source = unicode(source)
+        if ttype in cls._preload_types:
+            snapshot = cls.get_preload(lang)
+            if snapshot is not None:
+                return snapshot.get((ttype, name, source))
         trans = cls._translation_cache.get((lang, ttype, name, source), -1)
         if trans != -1:
             return trans
@@ -641,12 +725,20 @@ class Translation(ModelSQL, ModelView):
             for sub_args in grouped_slice(args):
                 res.update(cls.get_sources(list(sub_args)))
             return res
+        snapshots = {}
         for name, ttype, lang, source in args:
             name = unicode(name)
             ttype = unicode(ttype)
             lang = unicode(lang)
             if source is not None:
                 source = unicode(source)
+            if ttype in cls._preload_types:
+                if lang not in snapshots:
+                    snapshots[lang] = cls.get_preload(lang)
+                if snapshots[lang] is not None:
+                    res[(name, ttype, lang, source)] = snapshots[lang].get(
+                        (ttype, name, source))
+                    continue
             trans = cls._translation_cache.get((lang, ttype, name, source), -1)
             if trans != -1:
                 res[(name, ttype, lang, source)] = trans
@@ -682,13 +774,19 @@ class Translation(ModelSQL, ModelView):
     @classmethod
     def delete(cls, translations):
         cls._translation_cache.clear()
+        cls._translation_preload_cache.clear()
         ModelView._fields_view_get_cache.clear()
+        cls._clear_model_record_caches([t.name for t in translations
+                if t.type == 'model'])
         return super(Translation, cls).delete(translations)
 
     @classmethod
     def create(cls, vlist):
         cls._translation_cache.clear()
+        cls._translation_preload_cache.clear()
         ModelView._fields_view_get_cache.clear()
+        cls._clear_model_record_caches([v.get('name') for v in vlist
+                if v.get('type') == 'model'])
         vlist = [x.copy() for x in vlist]
 
         cursor = Transaction().cursor
@@ -723,10 +821,14 @@ class Translation(ModelSQL, ModelView):
     @classmethod
     def write(cls, translations, values, *args):
         cls._translation_cache.clear()
+        cls._translation_preload_cache.clear()
         ModelView._fields_view_get_cache.clear()
         actions = iter((translations, values) + args)
         args = []
         for translations, values in zip(actions, actions):
+            # The type or the name may be modified
+            cls._clear_model_record_caches([t.name for t in translations]
+                + [values.get('name')])
             if 'src' in values:
                 values = values.copy()
                 values['src_md5'] = cls.get_src_md5(values.get('src'))
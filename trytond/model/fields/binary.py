@@ -44,7 +44,7 @@ class Binary(Field):
         res = {}
         converter = buffer
         default = None
-        format_ = Transaction().context.pop('%s.%s' % (model.__name__, name),
+        format_ = Transaction().context.get('%s.%s' % (model.__name__, name),
             '')
         if format_ == 'size':
             converter = len
@@ -4,7 +4,8 @@ from collections import namedtuple
 import warnings
 from functools import wraps
 
-from sql import operators, Column, Literal, Select, CombiningQuery, Null
+from sql import operators, Column, Literal, Select, CombiningQuery, Null, \
+    Table
 from sql.conditionals import Coalesce, NullIf
 from sql.operators import Concat
 
@@ -64,6 +65,22 @@ def size_validate(value):
                 'size must return integer'
 
 
+def search_table(Model, query):
+    '''
+    Return the table of the Model from which the search query selects the ids
+    or None if the query is not a plain select on it.
+    '''
+    if not isinstance(query, Select) or not query.columns:
+        return None
+    column = query.columns[0]
+    column = getattr(column, 'expression', column)
+    if not isinstance(column, Column):
+        return None
+    table = column.table
+    if isinstance(table, Table) and table._name == Model._table:
+        return table
+
+
 def depends(*fields, **kwargs):
     methods = kwargs.pop('methods', None)
     assert not kwargs
@@ -91,6 +108,19 @@ def depends(*fields, **kwargs):
     return decorator
 
 
+def record_independent(func):
+    '''
+    Mark the default method as returning the same value for every record
+    so it could be computed once for all the records created together.
+    It can be applied above or under classmethod.
+    '''
+    if isinstance(func, classmethod):
+        setattr(func.__func__, 'record_independent', True)
+    else:
+        setattr(func, 'record_independent', True)
+    return func
+
+
 SQL_OPERATORS = {
     '=': operators.Equal,
     '!=': operators.NotEqual,
@@ -310,40 +340,11 @@ class FieldTranslate(Field):
                 & (translation.type == 'model')
                 & (translation.fuzzy == False))
 
-    def convert_domain(self, domain, tables, Model):
+    def _get_translation_column(self, Model, name, tables):
+        "Add the translation join to tables and return the translated column"
         pool = Pool()
         Translation = pool.get('ir.translation')
         IrModel = pool.get('ir.model')
-        if not self.translate:
-            return super(FieldTranslate, self).convert_domain(
-                domain, tables, Model)
-
-        table = Model.__table__()
-        translation = Translation.__table__()
-        model = IrModel.__table__()
-        name, operator, value = domain
-        join = self._get_translation_join(Model, name,
-            translation, model, table)
-        Operator = SQL_OPERATORS[operator]
-        assert name == self.name
-        column = Coalesce(NullIf(translation.value, ''),
-            self.sql_column(table))
-        where = Operator(column, self._domain_value(operator, value))
-        if isinstance(where, operators.In) and not where.right:
-            where = Literal(False)
-        elif isinstance(where, operators.NotIn) and not where.right:
-            where = Literal(True)
-        where = self._domain_add_null(column, operator, value, where)
-        return tables[None][0].id.in_(join.select(table.id, where=where))
-
-    def convert_order(self, name, tables, Model):
-        pool = Pool()
-        Translation = pool.get('ir.translation')
-        IrModel = pool.get('ir.model')
-        if not self.translate:
-            return super(FieldTranslate, self).convert_order(name, tables,
-                Model)
-        assert name == self.name
 
         table, _ = tables[None]
         key = name + '.translation'
@@ -369,7 +370,29 @@ class FieldTranslate(Field):
             else:
                 translation, _ = tables[key]['translation'][None]
 
-        return [Coalesce(NullIf(translation.value, ''),
-                self.sql_column(table))]
+        return Coalesce(NullIf(translation.value, ''),
+            self.sql_column(table))
+
+    def convert_domain(self, domain, tables, Model):
+        if not self.translate:
+            return super(FieldTranslate, self).convert_domain(
+                domain, tables, Model)
+        name, operator, value = domain
+        assert name == self.name
+        column = self._get_translation_column(Model, name, tables)
+        Operator = SQL_OPERATORS[operator]
+        where = Operator(column, self._domain_value(operator, value))
+        if isinstance(where, operators.In) and not where.right:
+            where = Literal(False)
+        elif isinstance(where, operators.NotIn) and not where.right:
+            where = Literal(True)
+        return self._domain_add_null(column, operator, value, where)
+
+    def convert_order(self, name, tables, Model):
+        if not self.translate:
+            return super(FieldTranslate, self).convert_order(name, tables,
+                Model)
+        assert name == self.name
+        return [self._get_translation_column(Model, name, tables)]
 
 SQLType = namedtuple('SQLType', 'base type')
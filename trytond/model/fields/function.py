@@ -13,7 +13,7 @@ class Function(Field):
     '''
 
     def __init__(self, field, getter, setter=None, searcher=None,
-            loading='lazy'):
+            loading='lazy', store=False):
         '''
         :param field: The field of the function.
         :param getter: The name of the function for getting values.
@@ -21,6 +21,8 @@ class Function(Field):
         :param searcher: The name of the function to search.
         :param loading: Define how the field must be loaded:
             ``lazy`` or ``eager``.
+        :param store: A boolean to store the value in a column computed when
+            the depends change.
         '''
         assert isinstance(field, Field)
         self._field = field
@@ -33,16 +35,21 @@ class Function(Field):
         assert loading in ('lazy', 'eager'), \
             'loading must be "lazy" or "eager"'
         self.loading = loading
+        assert not store or not hasattr(field, 'get'), \
+            'only fields with a column can be stored'
+        self.store = store
 
     __init__.__doc__ += Field.__init__.__doc__
 
     def __copy__(self):
         return Function(copy.copy(self._field), self.getter,
-            setter=self.setter, searcher=self.searcher, loading=self.loading)
+            setter=self.setter, searcher=self.searcher, loading=self.loading,
+            store=self.store)
 
     def __deepcopy__(self, memo):
         return Function(copy.deepcopy(self._field, memo), self.getter,
-            setter=self.setter, searcher=self.searcher, loading=self.loading)
+            setter=self.setter, searcher=self.searcher, loading=self.loading,
+            store=self.store)
 
     def __getattr__(self, name):
         return getattr(self._field, name)
@@ -51,7 +58,8 @@ class Function(Field):
         return self._field[name]
 
     def __setattr__(self, name, value):
-        if name in ('_field', '_type', 'getter', 'setter', 'searcher', 'name'):
+        if name in ('_field', '_type', 'getter', 'setter', 'searcher', 'store',
+                'name'):
             object.__setattr__(self, name, value)
             if name != 'name':
                 return
@@ -59,14 +67,26 @@ class Function(Field):
 
     @property
     def sql_type(self):
-        raise AttributeError
+        if not self.store:
+            raise AttributeError
+        return self._field.sql_type
+
+    def sql_format(self, value):
+        return self._field.sql_format(value)
 
     def convert_domain(self, domain, tables, Model):
         name, operator, value = domain[:3]
         if not self.searcher:
+            if self.store:
+                return self._field.convert_domain(domain, tables, Model)
             Model.raise_user_error('search_function_missing', name)
         return getattr(Model, self.searcher)(name, domain)
 
+    def convert_order(self, name, tables, Model):
+        if self.store:
+            return self._field.convert_order(name, tables, Model)
+        return super(Function, self).convert_order(name, tables, Model)
+
     def get(self, ids, Model, name, values=None):
         '''
         Call the getter.
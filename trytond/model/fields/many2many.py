@@ -2,12 +2,13 @@
 # this repository contains the full copyright notices and license terms.
 from itertools import chain
 
-from sql import Cast, Literal, Null
+from sql import Cast, Literal, Null, With
 from sql.functions import Substring, Position
 
-from .field import Field, size_validate
+from .field import Field, size_validate, search_table
 from ...pool import Pool
-from ...tools import grouped_slice
+from ...tools import grouped_slice, reduce_ids
+from ...transaction import Transaction
 
 
 class Many2Many(Field):
@@ -67,6 +68,7 @@ class Many2Many(Field):
         '''
         Return target records ordered.
         '''
+        from ..modelsql import ModelSQL
         if values is None:
             values = {}
         res = {}
@@ -82,6 +84,14 @@ class Many2Many(Field):
 
         Relation = Pool().get(self.relation_name)
         origin_field = Relation._fields[self.origin]
+        target_field = Relation._fields[self.target]
+
+        # Fetch only the ids without instantiating the records
+        fetch = (issubclass(Relation, ModelSQL)
+            and target_field._type == 'many2one'
+            and all(not hasattr(f, 'set') or getattr(f, 'store', False)
+                for f in (origin_field, target_field)))
+        cursor = Transaction().cursor
 
         relations = []
         for sub_ids in grouped_slice(ids):
@@ -91,7 +101,19 @@ class Many2Many(Field):
             else:
                 clause = [(self.origin, 'in', list(sub_ids))]
             clause += [(self.target + '.id', '!=', None)]
-            relations.append(Relation.search(clause, order=order))
+            if fetch:
+                query = Relation.search(clause, order=order, query=True)
+                table = search_table(Relation, query)
+            if fetch and table is not None:
+                query.columns = [origin_field.sql_column(table),
+                    target_field.sql_column(table)]
+                cursor.execute(*query)
+                for origin, target_id in cursor.fetchall():
+                    if origin_field._type == 'reference':
+                        origin = int(origin.split(',', 1)[1])
+                    res[origin].append(target_id)
+            else:
+                relations.append(Relation.search(clause, order=order))
         relations = list(chain(*relations))
 
         for relation in relations:
@@ -240,9 +262,32 @@ class Many2Many(Field):
         super(Many2Many, self).__set__(inst, value)
 
     def convert_domain_child(self, domain, tables):
+        pool = Pool()
         Target = self.get_target()
+        Relation = pool.get(self.relation_name)
         table, _ = tables[None]
         name, operator, ids = domain
+        if (Transaction().cursor.has_recursive_cte()
+                and Relation._fields[self.origin]._type != 'reference'
+                and not Target.table_query()
+                and not Relation.table_query()
+                and not ((Target._history or Relation._history)
+                    and Transaction().context.get('_datetime'))):
+            target = Target.__table__()
+            relation = Relation.__table__()
+            origin = getattr(Relation, self.origin).sql_column(relation)
+            parent = getattr(Relation, self.target).sql_column(relation)
+            tree = With('id', recursive=True)
+            tree.query = target.select(target.id,
+                where=reduce_ids(target.id, ids))
+            tree.query |= relation.join(tree,
+                condition=parent == tree.id
+                ).select(origin)
+            expression = table.id.in_(tree.select(tree.id, with_=[tree]))
+            if operator == 'not child_of':
+                return ~expression
+            return expression
+
         ids = list(ids)  # Ensure it is a list for concatenation
 
         def get_child(ids):
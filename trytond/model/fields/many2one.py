@@ -1,7 +1,7 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 from types import NoneType
-from sql import Query, Expression
+from sql import Query, Expression, With
 from sql.operators import Or
 
 from .field import Field, SQLType
@@ -115,6 +115,23 @@ class Many2One(Field):
         Target = self.get_target()
         table, _ = tables[None]
         name, operator, ids = domain
+        if (Transaction().cursor.has_recursive_cte()
+                and not Target.table_query()
+                and not (Target._history
+                    and Transaction().context.get('_datetime'))):
+            target = Target.__table__()
+            child = Target.__table__()
+            tree = With('id', recursive=True)
+            tree.query = target.select(target.id,
+                where=reduce_ids(target.id, ids))
+            tree.query |= child.join(tree,
+                condition=self.sql_column(child) == tree.id
+                ).select(child.id)
+            expression = table.id.in_(tree.select(tree.id, with_=[tree]))
+            if operator == 'not child_of':
+                return ~expression
+            return expression
+
         ids = list(ids)  # Ensure it is a list for concatenation
 
         def get_child(ids):
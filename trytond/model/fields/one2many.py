@@ -4,9 +4,10 @@ from itertools import chain
 from sql import Cast, Literal
 from sql.functions import Substring, Position
 
-from .field import Field, size_validate
+from .field import Field, size_validate, search_table
 from ...pool import Pool
 from ...tools import grouped_slice
+from ...transaction import Transaction
 
 
 def add_remove_validate(value):
@@ -79,6 +80,7 @@ class One2Many(Field):
         '''
         Return target records ordered.
         '''
+        from ..modelsql import ModelSQL
         pool = Pool()
         Relation = pool.get(self.model_name)
         field = Relation._fields[self.field]
@@ -86,6 +88,11 @@ class One2Many(Field):
         for i in ids:
             res[i] = []
 
+        # Fetch only the ids without instantiating the records
+        fetch = (issubclass(Relation, ModelSQL)
+            and (not hasattr(field, 'set') or getattr(field, 'store', False)))
+        cursor = Transaction().cursor
+
         targets = []
         for sub_ids in grouped_slice(ids):
             if field._type == 'reference':
@@ -93,7 +100,19 @@ class One2Many(Field):
                 clause = [(self.field, 'in', references)]
             else:
                 clause = [(self.field, 'in', list(sub_ids))]
-            targets.append(Relation.search(clause, order=self.order))
+            if fetch:
+                query = Relation.search(clause, order=self.order, query=True)
+                table = search_table(Relation, query)
+            if fetch and table is not None:
+                query.columns = list(query.columns) + [
+                    field.sql_column(table)]
+                cursor.execute(*query)
+                for target_id, origin in cursor.fetchall():
+                    if field._type == 'reference':
+                        origin = int(origin.split(',', 1)[1])
+                    res[origin].append(target_id)
+            else:
+                targets.append(Relation.search(clause, order=self.order))
         targets = list(chain(*targets))
 
         for target in targets:
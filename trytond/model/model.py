@@ -231,10 +231,12 @@ class Model(WarningErrorMixin, URLMixin, PoolBase):
                         arg))
             if (isinstance(cls._fields[field],
                         (fields.Function, fields.One2Many))
+                    and not getattr(cls._fields[field], 'store', False)
                     and not getattr(cls, 'order_%s' % field, None)):
                 res[field]['sortable'] = False
             if ((isinstance(cls._fields[field], fields.Function)
-                    and not cls._fields[field].searcher)
+                    and not cls._fields[field].searcher
+                    and not cls._fields[field].store)
                     or cls._fields[field]._type in ('binary', 'sha')):
                 res[field]['searchable'] = False
             else:
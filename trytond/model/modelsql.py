@@ -3,12 +3,14 @@
 import re
 import datetime
 from functools import reduce
-from itertools import islice, izip, chain, ifilter
+from itertools import islice, izip, chain, groupby
+from operator import itemgetter
 
-from sql import Table, Column, Literal, Desc, Asc, Expression, Flavor, Null
+from sql import Table, Column, Literal, Desc, Asc, Expression, Flavor, \
+    Null, With
 from sql.functions import Now, Extract
-from sql.conditionals import Coalesce
-from sql.operators import Or, And, Operator
+from sql.conditionals import Coalesce, Case
+from sql.operators import Or, And, Operator, Exists
 from sql.aggregate import Count, Max
 
 from trytond.model import ModelStorage, ModelView
@@ -18,14 +20,18 @@ from trytond.tools import reduce_ids, grouped_slice
 from trytond.const import OPERATORS
 from trytond.transaction import Transaction
 from trytond.pool import Pool
-from trytond.cache import LRUDict
 from trytond.exceptions import ConcurrencyException
 from trytond.rpc import RPC
+from trytond.cache import Cache
+from trytond.config import config
 
 from .modelstorage import cache_size
 
 _RE_UNIQUE = re.compile('UNIQUE\s*\((.*)\)', re.I)
 _RE_CHECK = re.compile('CHECK\s*\((.*)\)', re.I)
+_record_caches = {}
+# Incremented at each setup as the stored parents depend on the other models
+_setup_generation = [0]
 
 
 class ModelSQL(ModelStorage):
@@ -36,6 +42,7 @@ class ModelSQL(ModelStorage):
     _order = None
     _order_name = None  # Use to force order field when sorting on Many2One
     _history = False
+    _record_cache = False  # Keep the rows read across transactions
 
     @classmethod
     def __setup__(cls):
@@ -54,6 +61,15 @@ class ModelSQL(ModelStorage):
         assert cls._table[-9:] != '__history', \
             'Model _table %s cannot end with "__history"' % cls._table
 
+        if cls._record_cache and cls.__name__ not in _record_caches:
+            _record_caches[cls.__name__] = Cache(cls.__name__ + '.read',
+                size_limit=config.getint('cache', 'record'), context=False)
+
+    @classmethod
+    def __post_setup__(cls):
+        super(ModelSQL, cls).__post_setup__()
+        _setup_generation[0] += 1
+
     @classmethod
     def __table__(cls):
         return cls.table_query() or Table(cls._table)
@@ -64,6 +80,19 @@ class ModelSQL(ModelStorage):
             raise ValueError('No history table')
         return Table(cls._table + '__history')
 
+    @classmethod
+    def _get_record_cache(cls):
+        'Return the cache of the rows shared between transactions or None'
+        if not cls._record_cache or cls.table_query():
+            return None
+        return _record_caches.get(cls.__name__)
+
+    @classmethod
+    def _clear_record_cache(cls):
+        record_cache = cls._get_record_cache()
+        if record_cache is not None:
+            record_cache.clear()
+
     @classmethod
     def __register__(cls, module_name):
         TableHandler = backend.get('TableHandler')
@@ -81,12 +110,16 @@ class ModelSQL(ModelStorage):
                     module_name, history=True)
             history_table.index_action('id', action='add')
 
+        new_stored = set()
         for field_name, field in cls._fields.iteritems():
             if field_name == 'id':
                 continue
             default_fun = None
-            if hasattr(field, 'set'):
+            if hasattr(field, 'set') and not getattr(field, 'store', False):
                 continue
+            if (getattr(field, 'store', False)
+                    and not table.column_exist(field_name)):
+                new_stored.add(field_name)
             sql_type = field.sql_type()
             if field_name in cls._defaults:
                 default_fun = cls._defaults[field_name]
@@ -133,7 +166,8 @@ class ModelSQL(ModelStorage):
             table.index_action(
                 field_name, action=field.select and 'add' or 'remove')
 
-            required = field.required
+            # The stored functions are computed after the insertion
+            required = field.required and not hasattr(field, 'set')
             table.not_null_action(
                 field_name, action=required and 'add' or 'remove')
 
@@ -146,6 +180,14 @@ class ModelSQL(ModelStorage):
         for ident, constraint, _ in cls._sql_constraints:
             table.add_constraint(ident, constraint)
 
+        # Compute the new stored functions of the existing records
+        if new_stored:
+            cursor = Transaction().cursor
+            sql_table = cls.__table__()
+            cursor.execute(*sql_table.select(sql_table.id))
+            cls.__store_functions([r[0] for r in cursor.fetchall()],
+                field_names=new_stored)
+
         if cls._history:
             cls._update_history_table()
             cursor = Transaction().cursor
@@ -156,7 +198,8 @@ class ModelSQL(ModelStorage):
                 cursor.execute(*history_table.select(history_table.id))
                 if not cursor.fetchone():
                     columns = [n for n, f in cls._fields.iteritems()
-                        if not hasattr(f, 'set')]
+                        if not hasattr(f, 'set')
+                        or getattr(f, 'store', False)]
                     cursor.execute(*history_table.insert(
                             [Column(history_table, c) for c in columns],
                             table.select(*(Column(table, c)
@@ -231,6 +274,20 @@ class ModelSQL(ModelStorage):
             if name in exception[0]:
                 cls.raise_user_error(error)
 
+    @classmethod
+    def __raise_write_error(cls, sub_ids, domain):
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        if domain:
+            cursor.execute(*table.select(table.id,
+                    where=reduce_ids(table.id, sub_ids)))
+            rowcount = cursor.rowcount
+            if rowcount == -1 or rowcount is None:
+                rowcount = len(cursor.fetchall())
+            if rowcount == len({}.fromkeys(sub_ids)):
+                cls.raise_user_error('access_error', cls.__name__)
+        cls.raise_user_error('write_error', cls.__name__)
+
     @classmethod
     def history_revisions(cls, ids):
         pool = Pool()
@@ -283,7 +340,7 @@ class ModelSQL(ModelStorage):
                 'write_date': cls.write_date,
                 }
         for fname, field in sorted(fields.iteritems()):
-            if hasattr(field, 'set'):
+            if hasattr(field, 'set') and not getattr(field, 'store', False):
                 continue
             columns.append(Column(table, fname))
             hcolumns.append(Column(history, fname))
@@ -321,6 +378,8 @@ class ModelSQL(ModelStorage):
             return all(not v for n, v in zip(fnames, values)
                 if n not in ['id', 'write_uid', 'write_date'])
 
+        parents = cls.__stored_parents(ids)
+
         to_delete = []
         to_update = []
         for id_ in ids:
@@ -349,13 +408,20 @@ class ModelSQL(ModelStorage):
                 if rowcount < 1:
                     cursor.execute(*table.insert(columns, [values]))
 
+        # Increase transaction counter
+        transaction.counter += 1
+        cls._clear_record_cache()
+
         if to_delete:
             for sub_ids in grouped_slice(to_delete):
                 where = reduce_ids(table.id, sub_ids)
                 cursor.execute(*table.delete(where=where))
             cls.__insert_history(to_delete, True)
         if to_update:
+            # The stored functions are not restored but computed
+            cls.__store_functions(to_update)
             cls.__insert_history(to_update)
+        cls.__store_parents(cls.__stored_parents(to_update, parents))
 
     @classmethod
     def restore_history(cls, ids, datetime):
@@ -408,9 +474,10 @@ class ModelSQL(ModelStorage):
 
         table = cls.__table__()
         modified_fields = set()
-        new_ids = []
+        to_insert = []
+        defaults_cache = {}
         vlist = [v.copy() for v in vlist]
-        for values in vlist:
+        for index, values in enumerate(vlist):
             # Clean values
             for key in ('create_uid', 'create_date',
                     'write_uid', 'write_date', 'id'):
@@ -427,56 +494,97 @@ class ModelSQL(ModelStorage):
                     default.append(f)
 
             if default:
-                defaults = cls.default_get(default, with_rec_name=False)
+                # The records missing the same fields share the defaults which
+                # do not depend on the record
+                key = tuple(default)
+                if key not in defaults_cache:
+                    dependent = [f for f in default
+                        if f in cls._defaults
+                        and not getattr(cls._defaults[f],
+                            'record_independent', False)]
+                    independent = [f for f in default if f not in dependent]
+                    defaults_cache[key] = (
+                        cls.default_get(independent, with_rec_name=False),
+                        dependent)
+                defaults, dependent = defaults_cache[key]
+                defaults = defaults.copy()
+                if dependent:
+                    defaults.update(
+                        cls.default_get(dependent, with_rec_name=False))
                 values.update(cls._clean_defaults(defaults))
 
-            insert_columns = [table.create_uid, table.create_date]
+            # Group the consecutive records with the same columns to insert
+            # them together and keep the ids in the creation order
+            fnames = tuple(sorted(fname for fname in values
+                    if not hasattr(cls._fields[fname], 'set')))
             insert_values = [transaction.user, Now()]
+            insert_values.extend(cls._fields[fname].sql_format(values[fname])
+                for fname in fnames)
+            if not to_insert or to_insert[-1][0] != fnames:
+                to_insert.append((fnames, []))
+            to_insert[-1][1].append((index, insert_values))
 
-            # Insert record
-            for fname, value in values.iteritems():
-                field = cls._fields[fname]
-                if not hasattr(field, 'set'):
-                    insert_columns.append(Column(table, fname))
-                    insert_values.append(field.sql_format(value))
-
-            try:
-                if cursor.has_returning():
-                    cursor.execute(*table.insert(insert_columns,
-                            [insert_values], [table.id]))
-                    id_new, = cursor.fetchone()
-                else:
-                    id_new = cursor.nextid(cls._table)
-                    if id_new:
-                        insert_columns.append(table.id)
-                        insert_values.append(id_new)
+        new_ids = []
+        for fnames, rows in to_insert:
+            insert_columns = [table.create_uid, table.create_date]
+            insert_columns.extend(Column(table, fname) for fname in fnames)
+            for sub_rows in grouped_slice(rows, cursor.IN_MAX):
+                indexes, insert_values = zip(*sub_rows)
+                try:
+                    if cursor.has_returning():
                         cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
+                                list(insert_values), [table.id]))
+                        sub_ids = [x for x, in cursor.fetchall()]
+                    elif backend.name() == 'sqlite':
+                        for query, params in groupby((tuple(
+                                        table.insert(insert_columns, [v]))
+                                    for v in insert_values),
+                                key=itemgetter(0)):
+                            cursor.executemany(query,
+                                [p for _, p in params])
+                        # SQLite locks the database so the ids are sequential
+                        last_id = cursor.lastid()
+                        sub_ids = range(last_id - len(insert_values) + 1,
+                            last_id + 1)
                     else:
-                        cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
-                        id_new = cursor.lastid()
-                new_ids.append(id_new)
-            except DatabaseIntegrityError, exception:
-                with Transaction().new_cursor(), \
-                        Transaction().set_context(_check_access=False):
-                    cls.__raise_integrity_error(exception, values)
-                raise
+                        sub_ids = []
+                        for insert_value in insert_values:
+                            id_new = cursor.nextid(cls._table)
+                            if id_new:
+                                cursor.execute(*table.insert(
+                                        insert_columns + [table.id],
+                                        [insert_value + [id_new]]))
+                            else:
+                                cursor.execute(*table.insert(insert_columns,
+                                        [insert_value]))
+                                id_new = cursor.lastid()
+                            sub_ids.append(id_new)
+                except DatabaseIntegrityError, exception:
+                    with Transaction().new_cursor(), \
+                            Transaction().set_context(_check_access=False):
+                        for index in indexes:
+                            cls.__raise_integrity_error(exception,
+                                vlist[index])
+                    raise
+                new_ids.extend(sub_ids)
 
         domain = pool.get('ir.rule').domain_get(cls.__name__,
-                mode='create')
+                mode='create', table=table)
         if domain:
             for sub_ids in grouped_slice(new_ids):
                 sub_ids = list(sub_ids)
                 red_sql = reduce_ids(table.id, sub_ids)
 
-                cursor.execute(*table.select(table.id,
-                        where=red_sql & table.id.in_(domain)))
-                if len(cursor.fetchall()) != len(sub_ids):
+                # An insert can not be filtered so only the count is fetched
+                cursor.execute(*table.select(Count(Literal(1)),
+                        where=red_sql & domain))
+                count, = cursor.fetchone()
+                if count != len(sub_ids):
                     cls.raise_user_error('access_error', cls.__name__)
 
         transaction.create_records.setdefault(cls.__name__,
             set()).update(new_ids)
+        cls._clear_record_cache()
 
         translation_values = {}
         fields_to_set = {}
@@ -500,6 +608,9 @@ class ModelSQL(ModelStorage):
             field = cls._fields[fname]
             field.set(cls, fname, *fargs)
 
+        cls.__store_functions(new_ids)
+        cls.__store_parents(cls.__stored_parents(new_ids))
+
         cls.__insert_history(new_ids)
 
         records = cls.browse(new_ids)
@@ -512,12 +623,52 @@ class ModelSQL(ModelStorage):
         cls.trigger_create(records)
         return records
 
+    @classmethod
+    def __read_join_target(cls, field_name, related):
+        '''
+        Return the target model if the related fields can be read by joining
+        its table
+        '''
+        pool = Pool()
+        field = cls._fields[field_name]
+        if (field._type != 'many2one'
+                or isinstance(field, fields.Function)
+                or getattr(field, 'datetime_field', None)):
+            return
+        Target = pool.get(field.model_name)
+        if (Target.read.im_func is not ModelSQL.read.im_func
+                or Target.table_query()
+                or Target._get_record_cache() is not None
+                or (Target._history
+                    and Transaction().context.get('_datetime'))):
+            return
+        for name in related:
+            target_field = Target._fields.get(name)
+            if (target_field is None
+                    or ((hasattr(target_field, 'get')
+                            or hasattr(target_field, 'set'))
+                        and not getattr(target_field, 'store', False))
+                    or getattr(target_field, 'translate', False)):
+                return
+        return Target
+
+    @staticmethod
+    def __group_datetime(rows, datetime_field):
+        '''
+        Return the rows grouped by the value of the datetime field
+        '''
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[datetime_field], []).append(row)
+        return groups.iteritems()
+
     @classmethod
     def read(cls, ids, fields_names=None):
         pool = Pool()
         Rule = pool.get('ir.rule')
         Translation = pool.get('ir.translation')
         ModelAccess = pool.get('ir.model.access')
+        ModelFieldAccess = pool.get('ir.model.field.access')
         if not fields_names:
             fields_names = []
             for field_name in cls._fields.keys():
@@ -530,9 +681,6 @@ class ModelSQL(ModelStorage):
         if not ids:
             return []
 
-        # construct a clause for the rules :
-        domain = Rule.domain_get(cls.__name__, mode='read')
-
         fields_related = {}
         datetime_fields = []
         for field_name in fields_names:
@@ -551,23 +699,20 @@ class ModelSQL(ModelStorage):
         table = cls.__table__()
         table_query = cls.table_query()
 
-        in_max = cursor.IN_MAX
-        history_order = None
         history_clause = None
-        history_limit = None
         if (cls._history
                 and Transaction().context.get('_datetime')
                 and not table_query):
-            in_max = 1
             table = cls.__table_history__()
-            column = Coalesce(table.write_date, table.create_date)
-            history_clause = (column <= Transaction().context['_datetime'])
-            history_order = (column.desc, Column(table, '__id').desc)
-            history_limit = 1
+            history_clause = cls.__history_last(table)
+
+        # construct a clause for the rules :
+        domain = Rule.domain_get(cls.__name__, mode='read', table=table)
 
         columns = []
         for f in fields_names + fields_related.keys() + datetime_fields:
-            if (f in cls._fields and not hasattr(cls._fields[f], 'set')):
+            if (f in cls._fields and (not hasattr(cls._fields[f], 'set')
+                        or getattr(cls._fields[f], 'store', False))):
                 columns.append(Column(table, f).as_(f))
             elif f == '_timestamp' and not table_query:
                 sql_type = fields.Char('timestamp').sql_type().base
@@ -575,29 +720,94 @@ class ModelSQL(ModelStorage):
                         Coalesce(table.write_date, table.create_date)
                         ).cast(sql_type).as_('_timestamp'))
 
+        # The cached rows are only valid without rule and modification
+        record_cache = cls._get_record_cache()
+        if domain or Transaction().counter:
+            record_cache = None
+
+        # The related fields of the many2one are read with the same query
+        from_ = table
+        related_columns = []
+        fields_joined = {}
+        if record_cache is None and not history_clause and not table_query:
+            for fname, related in fields_related.iteritems():
+                Target = cls.__read_join_target(fname, related)
+                if not Target:
+                    continue
+                ModelAccess.check(Target.__name__, 'read')
+                ModelFieldAccess.check(Target.__name__, related, 'read')
+                target = Target.__table__()
+                condition = target.id == Column(table, fname)
+                target_domain = Rule.domain_get(Target.__name__, mode='read',
+                    table=target)
+                if target_domain:
+                    condition &= target_domain
+                from_ = from_.join(target, 'LEFT', condition=condition)
+                for name in set(related) | {'id'}:
+                    related_columns.append(
+                        Column(target, name).as_('%s.%s' % (fname, name)))
+                fields_joined[fname] = Target
+
+        # The translated columns are read with the same query
+        fields_translated = set()
+        if (record_cache is None and not table_query
+                and not Transaction().context.get('fuzzy_translation')
+                and cls.__name__ not in ('ir.model', 'ir.model.field')):
+            tables = {None: (table, None)}
+            for i, column in enumerate(columns):
+                fname = column.output_name
+                field = cls._fields.get(fname)
+                if (not getattr(field, 'translate', False)
+                        or hasattr(field, 'set')):
+                    continue
+                columns[i] = field._get_translation_column(cls, fname,
+                    tables).as_(fname)
+                fields_translated.add(fname)
+            for key, sub_tables in tables.iteritems():
+                if key is not None:
+                    translation, condition = sub_tables[None]
+                    from_ = from_.join(translation, 'LEFT',
+                        condition=condition)
+
         if len(columns):
             if 'id' not in fields_names:
                 columns.append(table.id.as_('id'))
 
-            for sub_ids in grouped_slice(ids, in_max):
+            missing_ids = ids
+            if record_cache is not None:
+                cache_keys = (Transaction().language,
+                    Transaction().context.get('_datetime'))
+                names = [c.output_name for c in columns]
+                missing_ids = []
+                for id_ in set(ids):
+                    row = record_cache.get((id_,) + cache_keys)
+                    if row is not None and all(n in row for n in names):
+                        result.append(dict((n, row[n]) for n in names))
+                    else:
+                        missing_ids.append(id_)
+            # The rows read from a snapshot older than the last clear of the
+            # cache may be stale
+            fill_cache = (record_cache is not None
+                and not record_cache.cleared_since(Transaction().started))
+
+            for sub_ids in grouped_slice(missing_ids):
                 sub_ids = list(sub_ids)
                 red_sql = reduce_ids(table.id, sub_ids)
                 where = red_sql
                 if history_clause:
                     where &= history_clause
                 if domain:
-                    where &= table.id.in_(domain)
-                cursor.execute(*table.select(*columns, where=where,
-                        order_by=history_order, limit=history_limit))
+                    where &= domain
+                cursor.execute(*from_.select(*(columns + related_columns),
+                        where=where))
                 dictfetchall = cursor.dictfetchall()
                 if not len(dictfetchall) == len({}.fromkeys(sub_ids)):
                     if domain:
                         where = red_sql
                         if history_clause:
                             where &= history_clause
-                        where &= table.id.in_(domain)
-                        cursor.execute(*table.select(table.id, where=where,
-                                order_by=history_order, limit=history_limit))
+                        where &= domain
+                        cursor.execute(*table.select(table.id, where=where))
                         rowcount = cursor.rowcount
                         if rowcount == -1 or rowcount is None:
                             rowcount = len(cursor.fetchall())
@@ -605,12 +815,18 @@ class ModelSQL(ModelStorage):
                             cls.raise_user_error('access_error', cls.__name__)
                     cls.raise_user_error('read_error', cls.__name__)
                 result.extend(dictfetchall)
+                if fill_cache:
+                    for row in dictfetchall:
+                        key = (row['id'],) + cache_keys
+                        # The cached dict may be read by other threads
+                        cached = dict(record_cache.get(key) or {}, **row)
+                        record_cache.set(key, cached)
         else:
             result = [{'id': x} for x in ids]
 
         for column in columns:
             field = column.output_name
-            if field == '_timestamp':
+            if field == '_timestamp' or field in fields_translated:
                 continue
             if (getattr(cls._fields[field], 'translate', False)
                     and not hasattr(field, 'set')):
@@ -622,7 +838,8 @@ class ModelSQL(ModelStorage):
         # all fields for which there is a get attribute
         getter_fields = [f for f in
             fields_names + fields_related.keys() + datetime_fields
-            if f in cls._fields and hasattr(cls._fields[f], 'get')]
+            if f in cls._fields and hasattr(cls._fields[f], 'get')
+            and not getattr(cls._fields[f], 'store', False)]
         func_fields = {}
         for fname in getter_fields:
             field = cls._fields[fname]
@@ -631,12 +848,13 @@ class ModelSQL(ModelStorage):
                 func_fields.setdefault(key, [])
                 func_fields[key].append(fname)
             elif getattr(field, 'datetime_field', None):
-                for row in result:
-                    with Transaction().set_context(
-                            _datetime=row[field.datetime_field]):
-                        date_result = field.get([row['id']], cls, fname,
-                            values=[row])
-                    row[field] = date_result[row['id']]
+                for _datetime, rows in cls.__group_datetime(
+                        result, field.datetime_field):
+                    with Transaction().set_context(_datetime=_datetime):
+                        date_result = field.get([r['id'] for r in rows],
+                            cls, fname, values=rows)
+                    for row in rows:
+                        row[fname] = date_result[row['id']]
             else:
                 # get the value of that field for all records/ids
                 getter_result = field.get(ids, cls, fname, values=result)
@@ -649,19 +867,28 @@ class ModelSQL(ModelStorage):
             field = cls._fields[fname]
             _, datetime_field = key
             if datetime_field:
-                for row in result:
-                    with Transaction().set_context(
-                            _datetime=row[datetime_field]):
-                        date_results = field.get([row['id']], cls, field_list,
-                            values=[row])
+                for _datetime, rows in cls.__group_datetime(
+                        result, datetime_field):
+                    with Transaction().set_context(_datetime=_datetime):
+                        date_results = field.get([r['id'] for r in rows],
+                            cls, field_list, values=rows)
                     for fname, date_result in date_results.iteritems():
-                        row[fname] = date_result[row['id']]
+                        for row in rows:
+                            row[fname] = date_result[row['id']]
             else:
                 getter_results = field.get(ids, cls, field_list, values=result)
                 for fname, getter_result in getter_results.iteritems():
                     for row in result:
                         row[fname] = getter_result[row['id']]
 
+        for fname, Target in fields_joined.iteritems():
+            id_name = '%s.id' % fname
+            for row in result:
+                if row[fname] is not None and row[id_name] is None:
+                    Target.raise_user_error('access_error', Target.__name__)
+                if 'id' not in fields_related[fname]:
+                    del row[id_name]
+
         to_del = set()
         fields_related2values = {}
         for fname in fields_related.keys() + datetime_fields:
@@ -669,7 +896,7 @@ class ModelSQL(ModelStorage):
                 to_del.add(fname)
             if fname not in cls._fields:
                 continue
-            if fname not in fields_related:
+            if fname not in fields_related or fname in fields_joined:
                 continue
             fields_related2values.setdefault(fname, {})
             field = cls._fields[fname]
@@ -679,26 +906,27 @@ class ModelSQL(ModelStorage):
                 else:
                     Target = field.get_target()
                 if getattr(field, 'datetime_field', None):
-                    for row in result:
-                        if row[fname] is None:
-                            continue
-                        with Transaction().set_context(
-                                _datetime=row[field.datetime_field]):
-                            date_target, = Target.read([row[fname]],
+                    for _datetime, rows in cls.__group_datetime(
+                            [r for r in result if r[fname] is not None],
+                            field.datetime_field):
+                        with Transaction().set_context(_datetime=_datetime):
+                            date_targets = Target.read(
+                                list({r[fname] for r in rows}),
                                 fields_related[fname])
-                        target_id = date_target.pop('id')
-                        fields_related2values[fname].setdefault(target_id, {})
-                        fields_related2values[
-                            fname][target_id][row['id']] = date_target
+                        date_targets = {t.pop('id'): t for t in date_targets}
+                        for row in rows:
+                            fields_related2values[fname][row['id']] = \
+                                date_targets[row[fname]]
                 else:
+                    targets = {}
                     for target in Target.read(
-                            [r[fname] for r in result if r[fname]],
+                            list({r[fname] for r in result if r[fname]}),
                             fields_related[fname]):
-                        target_id = target.pop('id')
-                        fields_related2values[fname].setdefault(target_id, {})
-                        for row in result:
-                            fields_related2values[
-                                fname][target_id][row['id']] = target
+                        targets[target.pop('id')] = target
+                    for row in result:
+                        if row[fname]:
+                            fields_related2values[fname][row['id']] = \
+                                targets[row[fname]]
             elif field._type == 'reference':
                 for row in result:
                     if not row[fname]:
@@ -717,7 +945,7 @@ class ModelSQL(ModelStorage):
         if to_del or fields_related or datetime_fields:
             for row in result:
                 for fname in fields_related:
-                    if fname not in cls._fields:
+                    if fname not in cls._fields or fname in fields_joined:
                         continue
                     field = cls._fields[fname]
                     for related in fields_related[fname]:
@@ -726,7 +954,7 @@ class ModelSQL(ModelStorage):
                         if row[fname]:
                             if field._type in ('many2one', 'one2one'):
                                 value = fields_related2values[fname][
-                                    row[fname]][row['id']][related]
+                                    row['id']][related]
                             elif field._type == 'reference':
                                 model_name, record_id = row[fname
                                     ].split(',', 1)
@@ -764,6 +992,9 @@ class ModelSQL(ModelStorage):
             return
         table = cls.__table__()
 
+        # The previous parents must also be computed
+        parents = cls.__stored_parents(all_ids)
+
         cls.__check_timestamp(all_ids)
 
         fields_to_set = {}
@@ -789,35 +1020,37 @@ class ModelSQL(ModelStorage):
                         columns.append(Column(table, fname))
                         update_values.append(field.sql_format(value))
 
-            domain = pool.get('ir.rule').domain_get(cls.__name__, mode='write')
+            domain = pool.get('ir.rule').domain_get(cls.__name__, mode='write',
+                table=table)
             for sub_ids in grouped_slice(ids):
                 sub_ids = list(sub_ids)
                 red_sql = reduce_ids(table.id, sub_ids)
                 where = red_sql
                 if domain:
-                    where &= table.id.in_(domain)
-                cursor.execute(*table.select(table.id, where=where))
-                rowcount = cursor.rowcount
-                if rowcount == -1 or rowcount is None:
-                    rowcount = len(cursor.fetchall())
-                if not rowcount == len({}.fromkeys(sub_ids)):
-                    if domain:
-                        cursor.execute(*table.select(table.id, where=red_sql))
-                        rowcount = cursor.rowcount
-                        if rowcount == -1 or rowcount is None:
-                            rowcount = len(cursor.fetchall())
-                        if rowcount == len({}.fromkeys(sub_ids)):
-                            cls.raise_user_error('access_error', cls.__name__)
-                    cls.raise_user_error('write_error', cls.__name__)
+                    where &= domain
+                if not cursor.has_rowcount():
+                    cursor.execute(*table.select(table.id, where=where))
+                    rowcount = cursor.rowcount
+                    if rowcount == -1 or rowcount is None:
+                        rowcount = len(cursor.fetchall())
+                    if not rowcount == len({}.fromkeys(sub_ids)):
+                        cls.__raise_write_error(sub_ids, domain)
+                    # The rule is already checked and some databases can not
+                    # update a table selected in a sub-query of the rule
+                    where = red_sql
                 try:
                     cursor.execute(*table.update(columns, update_values,
-                            where=red_sql))
+                            where=where))
                 except DatabaseIntegrityError, exception:
                     with Transaction().new_cursor(), \
                             Transaction().set_context(_check_access=False):
                         cls.__raise_integrity_error(exception, values,
                             values.keys())
                     raise
+                # The rows updated are checked against the rule afterwards
+                if (cursor.has_rowcount()
+                        and not cursor.rowcount == len({}.fromkeys(sub_ids))):
+                    cls.__raise_write_error(sub_ids, domain)
 
             for fname, value in values.iteritems():
                 field = cls._fields[fname]
@@ -837,11 +1070,246 @@ class ModelSQL(ModelStorage):
             field = cls._fields[fname]
             field.set(cls, fname, *fargs)
 
+        cls.__store_functions(all_ids, all_field_names)
+        cls.__store_parents(cls.__stored_parents(all_ids, parents))
+
+        cls._clear_record_cache()
         cls.__insert_history(all_ids)
         for sub_records in grouped_slice(all_records, cache_size()):
             cls._validate(sub_records, field_names=all_field_names)
         cls.trigger_write(trigger_eligibles)
 
+    @classmethod
+    def __store_functions(cls, ids, field_names=None):
+        '''
+        Compute and store the values of the stored functions.
+        If field_names is set, only the functions depending on them are
+        computed.
+        '''
+        transaction = Transaction()
+        cursor = transaction.cursor
+        table = cls.__table__()
+
+        names = []
+        getters = {}
+        for fname, field in cls._fields.iteritems():
+            if not getattr(field, 'store', False):
+                continue
+            if (field_names is not None
+                    and fname not in field_names
+                    and not (set(field.depends) & field_names)):
+                continue
+            names.append(fname)
+            getters.setdefault(field.getter, []).append(fname)
+        if not names or not ids:
+            return
+
+        for sub_ids in grouped_slice(ids, cache_size()):
+            sub_ids = list(sub_ids)
+            values = dict((i, {}) for i in sub_ids)
+            for fnames in getters.itervalues():
+                field = cls._fields[fnames[0]]
+                for fname, result in field.get(sub_ids, cls,
+                        fnames).iteritems():
+                    sql_format = cls._fields[fname].sql_format
+                    for id_ in sub_ids:
+                        values[id_][fname] = sql_format(result.get(id_))
+
+            # Update at once the records with the same values
+            groups = {}
+            for id_, record_values in values.iteritems():
+                groups.setdefault(tuple(record_values[n] for n in names),
+                    []).append(id_)
+            for key, group_ids in groups.iteritems():
+                for sub_group_ids in grouped_slice(group_ids):
+                    cursor.execute(*table.update(
+                            [Column(table, n) for n in names], list(key),
+                            where=reduce_ids(table.id, sub_group_ids)))
+
+        # Clean cursor cache
+        for cache in cursor.cache.itervalues():
+            if cls.__name__ in cache:
+                for id_ in ids:
+                    if id_ in cache[cls.__name__]:
+                        cache[cls.__name__][id_].clear()
+        cls._clear_record_cache()
+
+    @classmethod
+    def __stored_parents(cls, ids, parents=None):
+        '''
+        Return the parent ids for each Many2One of the records targeting a
+        model with stored functions depending on the reverse One2Many.
+        The ids are added to parents if set.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        if parents is None:
+            parents = {}
+        for fname, (Model, names) in cls.__stored_parent_fields().iteritems():
+            _, parent_ids = parents.setdefault((Model, fname), (names, set()))
+            column = Column(table, fname)
+            for sub_ids in grouped_slice(ids):
+                cursor.execute(*table.select(column,
+                        where=reduce_ids(table.id, sub_ids)
+                        & (column != Null)))
+                parent_ids.update(r[0] for r in cursor.fetchall())
+        return parents
+
+    @classmethod
+    def __stored_parent_fields(cls):
+        '''
+        Return for each Many2One the target model and its One2Many names used
+        by its stored functions. It is computed once per setup of the pool.
+        '''
+        generation, result = cls.__dict__.get('_stored_parent_fields',
+            (None, None))
+        if generation == _setup_generation[0]:
+            return result
+        pool = Pool()
+        result = {}
+        for fname, field in cls._fields.iteritems():
+            if not isinstance(field, fields.Many2One):
+                continue
+            try:
+                Model = pool.get(field.model_name)
+            except KeyError:
+                # The target is not yet registered
+                continue
+            if not issubclass(Model, ModelSQL):
+                continue
+            names = set(n for n, f in Model._fields.iteritems()
+                if isinstance(f, fields.One2Many)
+                and f.model_name == cls.__name__
+                and f.field == fname)
+            if not names or not any(getattr(f, 'store', False)
+                    and set(f.depends) & names
+                    for f in Model._fields.itervalues()):
+                continue
+            result[fname] = (Model, names)
+        cls._stored_parent_fields = (_setup_generation[0], result)
+        return result
+
+    @staticmethod
+    def __store_parents(parents):
+        '''
+        Compute the stored functions of the parents
+        '''
+        transaction = Transaction()
+        for (Model, _), (names, parent_ids) in parents.iteritems():
+            # Skip the parents being deleted
+            parent_ids = parent_ids - transaction.delete.get(Model.__name__,
+                set())
+            Model.__store_functions(list(parent_ids), field_names=names)
+
+    @classmethod
+    def __can_delete_cascade(cls, _models=None):
+        """
+        Test if the records can be deleted by SQL when their parent is
+        deleted instead of calling delete.
+        """
+        pool = Pool()
+        Trigger = pool.get('ir.trigger')
+        if _models is None:
+            _models = set()
+        if cls.__name__ in _models:
+            return False
+        _models = _models | set([cls.__name__])
+        if (cls.delete.im_func is not ModelSQL.delete.im_func
+                or (cls.check_xml_record.im_func
+                    is not ModelStorage.check_xml_record.im_func)
+                or cls.table_query()
+                or cls._history
+                or Trigger.get_triggers(cls.__name__, 'delete')
+                or cls.__stored_parent_fields()):
+            return False
+        for field in cls._fields.itervalues():
+            if getattr(field, 'translate', False):
+                return False
+        for Model, field_name in pool.references(cls.__name__):
+            if hasattr(Model, 'table_query') and Model.table_query():
+                continue
+            if not issubclass(Model, ModelStorage):
+                continue
+            field = Model._fields[field_name]
+            if field.ondelete == 'CASCADE':
+                if (not issubclass(Model, ModelSQL)
+                        or not Model.__can_delete_cascade(_models)):
+                    return False
+            elif field.ondelete == 'SET NULL' and not field.required:
+                return False
+        return True
+
+    @classmethod
+    def __delete_cascade(cls, field_name, parent_ids):
+        """
+        Delete by SQL the records for which field_name is in parent_ids (a
+        list of ids or a query) and cascade to their children.
+        """
+        DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        ModelData = pool.get('ir.model.data')
+        transaction = Transaction()
+        cursor = transaction.cursor
+        table = cls.__table__()
+        model_data = ModelData.__table__()
+
+        where = Column(table, field_name).in_(parent_ids)
+        cursor.execute(*table.select(table.id, where=where))
+        deleted_ids = [x for x, in cursor.fetchall()]
+        if not deleted_ids:
+            return
+        ids = table.select(table.id, where=where)
+
+        ModelAccess.check(cls.__name__, 'delete')
+        if transaction.user != 0:
+            cursor.execute(*model_data.select(model_data.id,
+                    where=(model_data.model == cls.__name__)
+                    & model_data.db_id.in_(ids),
+                    limit=1))
+            if cursor.fetchone():
+                cls.raise_user_error('delete_xml_record',
+                    error_description='xml_record_desc')
+        domain = pool.get('ir.rule').domain_get(cls.__name__, mode='delete')
+        if domain:
+            cursor.execute(*table.select(table.id,
+                    where=where & ~table.id.in_(domain), limit=1))
+            if cursor.fetchone():
+                cls.raise_user_error('access_error', cls.__name__)
+
+        transaction.delete.setdefault(cls.__name__, set()).update(deleted_ids)
+        transaction.delete_records.setdefault(cls.__name__,
+            set()).update(deleted_ids)
+
+        for Model, fname in pool.references(cls.__name__):
+            if hasattr(Model, 'table_query') and Model.table_query():
+                continue
+            if not issubclass(Model, ModelStorage):
+                continue
+            if Model._fields[fname].ondelete == 'CASCADE':
+                Model.__delete_cascade(fname, ids)
+            else:
+                foreign_table = Model.__table__()
+                cursor.execute(*foreign_table.select(foreign_table.id,
+                        where=Column(foreign_table, fname).in_(ids),
+                        limit=1))
+                if cursor.fetchone():
+                    error_args = Model._get_error_args(fname)
+                    cls.raise_user_error('foreign_model_exist',
+                        error_args=error_args)
+
+        # Increase transaction counter
+        transaction.counter += 1
+        for cache in cursor.cache.itervalues():
+            cache.pop(cls.__name__, None)
+        cls._clear_record_cache()
+        try:
+            cursor.execute(*table.delete(where=where))
+        except DatabaseIntegrityError, exception:
+            with Transaction().new_cursor():
+                cls.__raise_integrity_error(exception, [])
+            raise
+
     @classmethod
     def delete(cls, records):
         DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
@@ -849,6 +1317,7 @@ class ModelSQL(ModelStorage):
         cursor = transaction.cursor
         pool = Pool()
         Translation = pool.get('ir.translation')
+        Trigger = pool.get('ir.trigger')
         ids = map(int, records)
 
         if not ids:
@@ -880,34 +1349,43 @@ class ModelSQL(ModelStorage):
         foreign_keys_tocheck = []
         foreign_keys_toupdate = []
         foreign_keys_todelete = []
-        for _, model in pool.iterobject():
+        for model, field_name in pool.references(cls.__name__):
             if hasattr(model, 'table_query') and model.table_query():
                 continue
             if not issubclass(model, ModelStorage):
                 continue
-            for field_name, field in model._fields.iteritems():
-                if (isinstance(field, fields.Many2One)
-                        and field.model_name == cls.__name__):
-                    if field.ondelete == 'CASCADE':
-                        foreign_keys_todelete.append((model, field_name))
-                    elif field.ondelete == 'SET NULL':
-                        if field.required:
-                            foreign_keys_tocheck.append((model, field_name))
-                        else:
-                            foreign_keys_toupdate.append((model, field_name))
-                    else:
-                        foreign_keys_tocheck.append((model, field_name))
+            field = model._fields[field_name]
+            if field.ondelete == 'CASCADE':
+                foreign_keys_todelete.append((model, field_name))
+            elif field.ondelete == 'SET NULL':
+                if field.required:
+                    foreign_keys_tocheck.append((model, field_name))
+                else:
+                    foreign_keys_toupdate.append((model, field_name))
+            else:
+                foreign_keys_tocheck.append((model, field_name))
+
+        sql_cascades = set(Model for Model, _ in foreign_keys_todelete
+            if issubclass(Model, ModelSQL) and Model.__can_delete_cascade())
+
+        parents = cls.__stored_parents(ids)
 
         transaction.delete.setdefault(cls.__name__, set()).update(ids)
 
-        domain = pool.get('ir.rule').domain_get(cls.__name__, mode='delete')
+        domain = pool.get('ir.rule').domain_get(cls.__name__, mode='delete',
+            table=table)
 
-        if domain:
+        # The rule can be checked by the rows deleted only if nothing is
+        # modified before
+        check_rowcount = (domain and cursor.has_rowcount()
+            and not foreign_keys_toupdate and not foreign_keys_todelete
+            and not Trigger.get_triggers(cls.__name__, 'delete'))
+        if domain and not check_rowcount:
             for sub_ids in grouped_slice(ids):
                 sub_ids = list(sub_ids)
                 red_sql = reduce_ids(table.id, sub_ids)
                 cursor.execute(*table.select(table.id,
-                        where=red_sql & table.id.in_(domain)))
+                        where=red_sql & domain))
                 rowcount = cursor.rowcount
                 if rowcount == -1 or rowcount is None:
                     rowcount = len(cursor.fetchall())
@@ -943,6 +1421,9 @@ class ModelSQL(ModelStorage):
                 if (not hasattr(Model, 'search')
                         or not hasattr(Model, 'delete')):
                     continue
+                if Model in sql_cascades:
+                    Model.__delete_cascade(field_name, sub_ids)
+                    continue
                 foreign_table = Model.__table__()
                 foreign_red_sql = reduce_ids(
                     Column(foreign_table, field_name), sub_ids)
@@ -963,15 +1444,24 @@ class ModelSQL(ModelStorage):
 
             super(ModelSQL, cls).delete(list(sub_records))
 
+            where = red_sql
+            if check_rowcount:
+                where &= domain
             try:
-                cursor.execute(*table.delete(where=red_sql))
+                cursor.execute(*table.delete(where=where))
             except DatabaseIntegrityError, exception:
                 with Transaction().new_cursor():
                     cls.__raise_integrity_error(exception, [])
                 raise
+            if (check_rowcount
+                    and not cursor.rowcount == len({}.fromkeys(sub_ids))):
+                cls.raise_user_error('access_error', cls._get_name())
 
+        cls._clear_record_cache()
         Translation.delete_ids(cls.__name__, 'model', ids)
 
+        cls.__store_parents(parents)
+
         cls.__insert_history(ids, deleted=True)
 
         cls._update_mptt(tree_ids.keys(), tree_ids.values())
@@ -1018,9 +1508,9 @@ class ModelSQL(ModelStorage):
         table = convert_from(None, tables)
 
         # construct a clause for the rules :
-        domain = Rule.domain_get(cls.__name__, mode='read')
+        domain = Rule.domain_get(cls.__name__, mode='read', table=main_table)
         if domain:
-            expression &= main_table.id.in_(domain)
+            expression &= domain
 
         if count:
             cursor.execute(*table.select(Count(Literal(1)),
@@ -1028,75 +1518,109 @@ class ModelSQL(ModelStorage):
             return cursor.fetchone()[0]
         # execute the "main" query to fetch the ids we were searching for
         columns = [main_table.id.as_('id')]
-        if (cls._history and transaction.context.get('_datetime')
-                and not query):
-            columns.append(Coalesce(
-                    main_table.write_date,
-                    main_table.create_date).as_('_datetime'))
-            columns.append(Column(main_table, '__id'))
         if not query:
-            columns += [Column(main_table, n).as_(n)
-                for n, f in cls._fields.iteritems()
-                if not hasattr(f, 'get')
-                and n != 'id'
-                and not getattr(f, 'translate', False)
-                and f.loading == 'eager']
-            if not cls.table_query():
-                sql_type = fields.Char('timestamp').sql_type().base
-                columns += [Extract('EPOCH',
-                        Coalesce(main_table.write_date, main_table.create_date)
-                        ).cast(sql_type).as_('_timestamp')]
+            columns += cls.__search_columns(main_table)
         select = table.select(*columns,
             where=expression, order_by=order_by, limit=limit, offset=offset)
         if query:
             return select
-        cursor.execute(*select)
 
-        rows = cursor.dictfetchmany(cursor.IN_MAX)
+        # The query is executed only once: the first rows fill the cache and
+        # only the ids of the next rows are fetched
+        stream = cursor.streaming_cursor()
+        try:
+            stream.execute(*select)
+            rows = stream.dictfetchmany(cursor.IN_MAX)
+            ids = cls.__search_cache(rows)
+            if len(rows) >= cursor.IN_MAX:
+                while True:
+                    sub_rows = stream.fetchmany(cursor.IN_MAX)
+                    if not sub_rows:
+                        break
+                    ids.extend(r[0] for r in sub_rows)
+        finally:
+            stream.close()
+        return cls.browse(ids)
+
+    @classmethod
+    def __search_columns(cls, main_table):
+        '''
+        Return the columns to fill the cache with the search query
+        '''
+        columns = [Column(main_table, n).as_(n)
+            for n, f in cls._fields.iteritems()
+            if (not hasattr(f, 'get') or getattr(f, 'store', False))
+            and n != 'id'
+            and not getattr(f, 'translate', False)
+            and f.loading == 'eager']
+        if not cls.table_query():
+            sql_type = fields.Char('timestamp').sql_type().base
+            columns += [Extract('EPOCH',
+                    Coalesce(main_table.write_date, main_table.create_date)
+                    ).cast(sql_type).as_('_timestamp')]
+        return columns
+
+    @classmethod
+    def search_iter(cls, domain, order=None, batch_size=None):
+        transaction = Transaction()
+        cursor = transaction.cursor
+        if batch_size is None:
+            batch_size = cache_size()
+
+        # Page on the order expressions and the id instead of using an offset
+        select = cls.search(domain, order=order, query=True)
+        id_ = select.columns[0].expression
+        keys = [(o.expression, isinstance(o, Desc)) for o in select.order_by]
+        keys.append((id_, False))
+        where = select.where
+        order_by = []
+        columns = [id_.as_('id')] + cls.__search_columns(id_.table)
+        for i, (expression, desc) in enumerate(keys):
+            # NULL values are explicitly sorted last
+            order_by.append(Asc(Case((expression == Null, 1), else_=0)))
+            order_by.append(Desc(expression) if desc else Asc(expression))
+            columns.append(expression.as_('_key_%s' % i))
+        select.columns = columns
+        select.order_by = order_by
+        select.limit = batch_size
+
+        while True:
+            cursor.execute(*select)
+            rows = cursor.dictfetchall()
+            if not rows:
+                break
+            for row in rows:
+                values = [row.pop('_key_%s' % i) for i in range(len(keys))]
+            yield cls.browse(cls.__search_cache(rows))
+            if len(rows) < batch_size:
+                break
+
+            # The next rows are those after the last one in the order
+            after, equal = [], []
+            for (expression, desc), value in zip(keys, values):
+                if value is None:
+                    equal.append(expression == Null)
+                    continue
+                next_ = (expression < value) if desc else (expression > value)
+                if expression is not id_:
+                    next_ |= (expression == Null)
+                after.append(And(equal + [next_]))
+                equal.append(expression == value)
+            after = Or(after)
+            select.where = after if where is None else (where & after)
+
+    @classmethod
+    def __search_cache(cls, rows):
+        '''
+        Fill the cache with the rows of search and return their ids
+        '''
+        transaction = Transaction()
+        cursor = transaction.cursor
         cache = cursor.get_cache()
-        if cls.__name__ not in cache:
-            cache[cls.__name__] = LRUDict(cache_size())
+        model_cache = cursor.get_model_cache(cache, cls.__name__, cache_size())
         delete_records = transaction.delete_records.setdefault(cls.__name__,
             set())
 
-        def filter_history(rows):
-            if not (cls._history and transaction.context.get('_datetime')):
-                return rows
-
-            def history_key(row):
-                return row['_datetime'], row['__id']
-
-            ids_history = {}
-            for row in rows:
-                key = history_key(row)
-                if row['id'] in ids_history:
-                    if key < ids_history[row['id']]:
-                        continue
-                ids_history[row['id']] = key
-
-            to_delete = set()
-            history = cls.__table_history__()
-            for sub_ids in grouped_slice([r['id'] for r in rows]):
-                where = reduce_ids(history.id, sub_ids)
-                cursor.execute(*history.select(history.id, history.write_date,
-                        where=where
-                        & (history.write_date != Null)
-                        & (history.create_date == Null)
-                        & (history.write_date
-                            <= transaction.context['_datetime'])))
-                for deleted_id, delete_date in cursor.fetchall():
-                    history_date, _ = ids_history[deleted_id]
-                    if isinstance(history_date, basestring):
-                        strptime = datetime.datetime.strptime
-                        format_ = '%Y-%m-%d %H:%M:%S.%f'
-                        history_date = strptime(history_date, format_)
-                    if history_date <= delete_date:
-                        to_delete.add(deleted_id)
-
-            return ifilter(lambda r: history_key(r) == ids_history[r['id']]
-                and r['id'] not in to_delete, rows)
-
-        rows = list(filter_history(rows))
         keys = None
         for data in islice(rows, 0, cache.size_limit):
             if data['id'] in delete_records:
@@ -1104,7 +1628,7 @@ class ModelSQL(ModelStorage):
             if keys is None:
                 keys = data.keys()
                 for k in keys[:]:
-                    if k in ('_timestamp', '_datetime', '__id'):
+                    if k == '_timestamp':
                         keys.remove(k)
                         continue
                     field = cls._fields[k]
@@ -1113,36 +1637,27 @@ class ModelSQL(ModelStorage):
                         continue
             for k in keys:
                 del data[k]
-            cache[cls.__name__].setdefault(data['id'], {}).update(data)
+            model_cache.setdefault(data['id'], {}).update(data)
+            model_cache.statistics.set += 1
 
-        if len(rows) >= cursor.IN_MAX:
-            if (cls._history
-                    and Transaction().context.get('_datetime')
-                    and not query):
-                columns = columns[:2]
-            else:
-                columns = columns[:1]
-            cursor.execute(*table.select(*columns,
-                    where=expression, order_by=order_by,
-                    limit=limit, offset=offset))
-            rows = filter_history(cursor.dictfetchall())
-
-        return cls.browse([x['id'] for x in rows])
+        return [r['id'] for r in rows]
 
     @classmethod
-    def search_domain(cls, domain, active_test=True):
+    def search_domain(cls, domain, active_test=True, tables=None):
         '''
         Return SQL tables and expression
         Set active_test to add it.
+        Set tables to compile the domain on its main table.
         '''
         transaction = Transaction()
         domain = cls._search_domain_active(domain, active_test=active_test)
 
-        tables = {
-            None: (cls.__table__(), None)
-            }
-        if cls._history and transaction.context.get('_datetime'):
-            tables[None] = (cls.__table_history__(), None)
+        if tables is None:
+            tables = {
+                None: (cls.__table__(), None)
+                }
+            if cls._history and transaction.context.get('_datetime'):
+                tables[None] = (cls.__table_history__(), None)
 
         def is_leaf(expression):
             return (isinstance(expression, (list, tuple))
@@ -1170,10 +1685,28 @@ class ModelSQL(ModelStorage):
 
         if cls._history and transaction.context.get('_datetime'):
             table, _ = tables[None]
-            expression &= (Coalesce(table.write_date, table.create_date)
-                <= transaction.context['_datetime'])
+            expression &= cls.__history_last(table)
+            # The last revision of a deleted record has no create date
+            expression &= (table.create_date != Null)
         return tables, expression
 
+    @classmethod
+    def __history_last(cls, table):
+        '''
+        Return the condition to keep only the last revision of the history
+        table at the _datetime of the context
+        '''
+        _datetime = Transaction().context['_datetime']
+        history = cls.__table_history__()
+        column = Coalesce(table.write_date, table.create_date)
+        history_column = Coalesce(history.write_date, history.create_date)
+        return (column <= _datetime) & ~Exists(history.select(history.id,
+                where=(history.id == table.id)
+                & (history_column <= _datetime)
+                & ((history_column > column)
+                    | ((history_column == column)
+                        & (Column(history, '__id') > Column(table, '__id'))))))
+
     @classmethod
     def _update_mptt(cls, field_names, list_ids, values=None):
         cursor = Transaction().cursor
@@ -1191,6 +1724,8 @@ class ModelSQL(ModelStorage):
                 if count is None:
                     cursor.execute(*cls.__table__().select(Count(Literal(1))))
                     count, = cursor.fetchone()
+                # The rebuild reads the whole table so it is used only when
+                # many nodes are moved
                 if len(ids) < count / 4:
                     for id_ in ids:
                         cls._update_tree(id_, field_name,
@@ -1205,23 +1740,48 @@ class ModelSQL(ModelStorage):
         '''
         cursor = Transaction().cursor
         table = cls.__table__()
-        right = left + 1
-
-        cursor.execute(*table.select(table.id,
-                where=Column(table, parent) == parent_id))
-        childs = cursor.fetchall()
-
-        for child_id, in childs:
-            right = cls._rebuild_tree(parent, child_id, right)
-
         field = cls._fields[parent]
-
-        if parent_id:
-            cursor.execute(*table.update(
-                    [Column(table, field.left), Column(table, field.right)],
-                    [left, right],
-                    where=table.id == parent_id))
-        return right + 1
+        left_column = Column(table, field.left)
+        right_column = Column(table, field.right)
+
+        cursor.execute(*table.select(table.id, Column(table, parent),
+                left_column, right_column, order_by=table.id.asc))
+        childs = {}
+        old_values = {}
+        for id_, parent_, old_left, old_right in cursor.fetchall():
+            childs.setdefault(parent_, []).append(id_)
+            old_values[id_] = (old_left, old_right)
+
+        # Walk the tree with a stack to not be limited by the recursion
+        values = {}
+        right = left + 1
+        stack = [(parent_id, left, iter(childs.get(parent_id, [])))]
+        while stack:
+            node_id, node_left, children = stack[-1]
+            for child_id in children:
+                stack.append(
+                    (child_id, right, iter(childs.get(child_id, []))))
+                right += 1
+                break
+            else:
+                stack.pop()
+                if node_id:
+                    values[node_id] = (node_left, right)
+                right += 1
+
+        to_update = [(id_, value) for id_, value in values.iteritems()
+            if old_values[id_] != value]
+        for sub_values in grouped_slice(to_update, cursor.IN_MAX // 2):
+            sub_values = list(sub_values)
+            cursor.execute(*table.update([left_column, right_column], [
+                        Case(*((table.id == id_, l)
+                                for id_, (l, _) in sub_values)),
+                        Case(*((table.id == id_, r)
+                                for id_, (_, r) in sub_values)),
+                        ],
+                    where=reduce_ids(table.id,
+                        [id_ for id_, _ in sub_values])))
+        return right
 
     @classmethod
     def _update_tree(cls, record_id, field_name, left, right):
@@ -1282,6 +1842,58 @@ class ModelSQL(ModelStorage):
                 [left + left_delta, right + right_delta],
                 where=(left >= left_cond) & (right <= right_cond)))
 
+    @classmethod
+    def check_recursion(cls, records, parent='parent', rec_name='rec_name'):
+        pool = Pool()
+        cursor = Transaction().cursor
+        field = cls._fields[parent]
+        if (not cursor.has_recursive_cte()
+                or field._type not in ('many2one', 'many2many')
+                or cls.table_query()):
+            return super(ModelSQL, cls).check_recursion(records,
+                parent=parent, rec_name=rec_name)
+
+        if field._type == 'many2many':
+            Relation = pool.get(field.relation_name)
+            if (Relation._fields[field.origin]._type == 'reference'
+                    or Relation.table_query()):
+                return super(ModelSQL, cls).check_recursion(records,
+                    parent=parent, rec_name=rec_name)
+            start = Relation.__table__()
+            step = Relation.__table__()
+            start_child = getattr(Relation, field.origin).sql_column(start)
+            start_parent = getattr(Relation, field.target).sql_column(start)
+            step_child = getattr(Relation, field.origin).sql_column(step)
+            step_parent = getattr(Relation, field.target).sql_column(step)
+        else:
+            start = cls.__table__()
+            step = cls.__table__()
+            start_child, start_parent = start.id, Column(start, parent)
+            step_child, step_parent = step.id, Column(step, parent)
+
+        # The tree contains each record with all its ancestors
+        table = cls.__table__()
+        for sub_records in grouped_slice(records):
+            sub_records = list(sub_records)
+            tree = With('id', 'ancestor', recursive=True)
+            tree.query = start.select(start_child, start_parent,
+                where=reduce_ids(start_child, map(int, sub_records))
+                & (start_parent != Null))
+            tree.query |= step.join(tree,
+                condition=step_child == tree.ancestor
+                ).select(tree.id, step_parent,
+                where=step_parent != Null)
+            # The query must start with SELECT otherwise pysqlite commits
+            cursor.execute(*table.select(table.id,
+                    where=table.id.in_(tree.select(tree.id,
+                            where=tree.id == tree.ancestor, with_=[tree]))))
+            recursive_ids = set(r for r, in cursor.fetchall())
+            if recursive_ids:
+                # Let the walk in Python raise the error with the names
+                super(ModelSQL, cls).check_recursion(
+                    cls.browse(list(recursive_ids)),
+                    parent=parent, rec_name=rec_name)
+
     @classmethod
     def validate(cls, records):
         super(ModelSQL, cls).validate(records)
@@ -352,6 +352,23 @@ class ModelStorage(Model):
             return len(res)
         return res
 
+    @classmethod
+    def search_iter(cls, domain, order=None, batch_size=None):
+        '''
+        Yield the records that match the domain by lists of batch_size.
+        '''
+        if batch_size is None:
+            batch_size = cache_size()
+        offset = 0
+        while True:
+            records = cls.search(domain, offset=offset, limit=batch_size,
+                order=order)
+            if records:
+                yield records
+            if len(records) < batch_size:
+                break
+            offset += batch_size
+
     @classmethod
     def search_read(cls, domain, offset=0, limit=None, order=None,
             fields_names=None):
@@ -1165,10 +1182,8 @@ class ModelStorage(Model):
 
     @property
     def _cache(self):
-        cache = self._cursor_cache
-        if self.__name__ not in cache:
-            cache[self.__name__] = LRUDict(cache_size())
-        return cache[self.__name__]
+        return self._cursor.get_model_cache(self._cursor_cache, self.__name__,
+            cache_size())
 
     def __getattr__(self, name):
         try:
@@ -1192,11 +1207,15 @@ class ModelStorage(Model):
             return self._local_cache[self.id][name]
         except KeyError:
             pass
-        try:
-            if field._type not in ('many2one', 'reference'):
-                return self._cache[self.id][name]
-        except KeyError:
-            pass
+        if field._type not in ('many2one', 'reference'):
+            cache = self._cache
+            try:
+                value = cache[self.id][name]
+            except KeyError:
+                cache.statistics.miss += 1
+            else:
+                cache.statistics.hit += 1
+                return value
 
         # build the list of fields we will fetch
         ffields = {
@@ -1308,6 +1327,7 @@ class ModelStorage(Model):
                 Transaction().set_user(self._user), \
                 Transaction().set_context(self._context):
             if self.id in self._cache and name in self._cache[self.id]:
+                self._cache.statistics.hit += 1
                 # Use values from cache
                 ids = islice(chain(islice(self._ids, index, None),
                         islice(self._ids, 0, max(index - 1, 0))),
@@ -1317,6 +1337,8 @@ class ModelStorage(Model):
                     for i in ids
                     if i in self._cache and name in self._cache[i]]
             else:
+                if field._type in ('many2one', 'reference'):
+                    self._cache.statistics.miss += 1
                 read_data = self.read(list(ids), ffields.keys())
             # create browse records for 'remote' models
             for data in read_data:
@@ -1342,6 +1364,7 @@ class ModelStorage(Model):
                 if data['id'] not in self._cache:
                     self._cache[data['id']] = {}
                 self._cache[data['id']].update(data)
+                self._cache.statistics.set += 1
         return value
 
     @property
@@ -40,9 +40,9 @@ def dispatch(host, port, protocol, database_name, user, session, object_type,
             except Exception:
                 return False
             res = security.login(database_name, user, session)
-            with Transaction().start(database_name, 0):
+            with Transaction().start(database_name, 0) as transaction:
                 Cache.clean(database_name)
-                Cache.resets(database_name)
+                Cache.resets(database_name, transaction.cursor)
             msg = res and 'successful login' or 'bad login or password'
             logger.info('%s \'%s\' from %s:%d using %s on database \'%s\''
                 % (msg, user, host, port, protocol, database_name))
@@ -120,6 +120,12 @@ def dispatch(host, port, protocol, database_name, user, session, object_type,
             method = args_list[-1]
             obj = pool.get(object_name, type=object_type)
             return pydoc.getdoc(getattr(obj, method))
+        elif method == 'cacheStatistics':
+            Cursor = backend.get('Cursor')
+            return {
+                'cache': Cache.get_statistics(database_name),
+                'record': Cursor.get_statistics(database_name),
+                }
 
     for count in range(config.getint('database', 'retry'), -1, -1):
         try:
@@ -182,7 +188,12 @@ def dispatch(host, port, protocol, database_name, user, session, object_type,
                 logger.error(exception_message, exc_info=sys.exc_info())
                 transaction.cursor.rollback()
                 raise
-            Cache.resets(database_name)
+            if not rpc.readonly:
+                # The request is committed so its cursor can be reused
+                Cache.resets(database_name, transaction.cursor)
+            else:
+                Cache.resets(database_name)
+            Cache.log_statistics(database_name)
         with Transaction().start(database_name, 0) as transaction:
             pool = Pool(database_name)
             Session = pool.get('ir.session')
@@ -100,6 +100,16 @@ def register():
         URLObject,
         ModelSQLRequiredField,
         ModelSQLTimestamp,
+        ModelSQLRecordCache,
+        ModelSQLDefault,
+        ModelSQLCascade,
+        ModelSQLCascadeChild,
+        ModelSQLCascadeGrandChild,
+        ModelSQLCascadeRestrict,
+        ModelSQLRead,
+        ModelSQLReadTarget,
+        ModelSQLStored,
+        ModelSQLStoredLine,
         Model4Union1,
         Model4Union2,
         Model4Union3,
@@ -112,6 +122,8 @@ def register():
         ModelViewChangedValues,
         ModelViewChangedValuesTarget,
         MPTT,
+        Tree,
+        TreeParent,
         ImportDataBoolean,
         ImportDataInteger,
         ImportDataIntegerRequired,
@@ -156,6 +168,7 @@ def register():
         Many2OneDomainValidation,
         TestHistory,
         TestHistoryLine,
+        TestHistoryDatetime,
         FieldContextChild,
         FieldContextParent,
         module='tests', type_='model')
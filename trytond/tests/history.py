@@ -1,8 +1,9 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 from trytond.model import ModelSQL, fields
+from trytond.transaction import Transaction
 
-__all__ = ['TestHistory', 'TestHistoryLine']
+__all__ = ['TestHistory', 'TestHistoryLine', 'TestHistoryDatetime']
 
 
 class TestHistory(ModelSQL):
@@ -19,3 +20,20 @@ class TestHistoryLine(ModelSQL):
     _history = True
     history = fields.Many2One('test.history', 'History')
     name = fields.Char('Name')
+
+
+class TestHistoryDatetime(ModelSQL):
+    'Test History Datetime'
+    __name__ = 'test.history.datetime'
+    stamp = fields.Timestamp('Stamp')
+    history = fields.Many2One('test.history', 'History',
+        datetime_field='stamp')
+    lines = fields.Function(fields.One2Many('test.history.line', None,
+            'Lines', datetime_field='stamp'), 'get_lines')
+    calls = []
+
+    @classmethod
+    def get_lines(cls, records, name):
+        cls.calls.append(Transaction().context.get('_datetime'))
+        return dict((r.id, [l.id for l in r.history.lines]
+                if r.history else []) for r in records)
@@ -4,6 +4,10 @@ from trytond.model import ModelSingleton, ModelSQL, UnionMixin, fields
 
 __all__ = [
     'Singleton', 'URLObject', 'ModelSQLRequiredField', 'ModelSQLTimestamp',
+    'ModelSQLRecordCache', 'ModelSQLDefault',
+    'ModelSQLCascade', 'ModelSQLCascadeChild', 'ModelSQLCascadeGrandChild',
+    'ModelSQLCascadeRestrict', 'ModelSQLRead', 'ModelSQLReadTarget',
+    'ModelSQLStored', 'ModelSQLStoredLine',
     'Model4Union1', 'Model4Union2', 'Model4Union3', 'Model4Union4',
     'Union', 'UnionUnion',
     'Model4UnionTree1', 'Model4UnionTree2', 'UnionTree',
@@ -39,6 +43,95 @@ class ModelSQLTimestamp(ModelSQL):
     __name__ = 'test.modelsql.timestamp'
 
 
+class ModelSQLRecordCache(ModelSQL):
+    'Model to test record cache'
+    __name__ = 'test.modelsql.record_cache'
+    _record_cache = True
+    name = fields.Char('Name')
+
+
+class ModelSQLDefault(ModelSQL):
+    'Model to test default'
+    __name__ = 'test.modelsql.default'
+    dependent = fields.Integer('Dependent')
+    independent = fields.Integer('Independent')
+    calls = []
+
+    @classmethod
+    def default_dependent(cls):
+        cls.calls.append('dependent')
+        return len(cls.calls)
+
+    @classmethod
+    @fields.record_independent
+    def default_independent(cls):
+        cls.calls.append('independent')
+        return len(cls.calls)
+
+
+class ModelSQLCascade(ModelSQL):
+    'Model to test cascade'
+    __name__ = 'test.modelsql.cascade'
+    children = fields.One2Many('test.modelsql.cascade.child', 'parent',
+        'Children')
+
+
+class ModelSQLCascadeChild(ModelSQL):
+    'Model to test cascade child'
+    __name__ = 'test.modelsql.cascade.child'
+    parent = fields.Many2One('test.modelsql.cascade', 'Parent',
+        ondelete='CASCADE')
+    children = fields.One2Many('test.modelsql.cascade.grandchild', 'parent',
+        'Children')
+
+
+class ModelSQLCascadeGrandChild(ModelSQL):
+    'Model to test cascade grand child'
+    __name__ = 'test.modelsql.cascade.grandchild'
+    parent = fields.Many2One('test.modelsql.cascade.child', 'Parent',
+        ondelete='CASCADE')
+
+
+class ModelSQLCascadeRestrict(ModelSQL):
+    'Model to test cascade restrict'
+    __name__ = 'test.modelsql.cascade.restrict'
+    child = fields.Many2One('test.modelsql.cascade.child', 'Child',
+        ondelete='RESTRICT')
+
+
+class ModelSQLRead(ModelSQL):
+    'Model to test read'
+    __name__ = 'test.modelsql.read'
+    target = fields.Many2One('test.modelsql.read.target', 'Target')
+
+
+class ModelSQLReadTarget(ModelSQL):
+    'Model to test read target'
+    __name__ = 'test.modelsql.read.target'
+    name = fields.Char('Name')
+    code = fields.Char('Code')
+
+
+class ModelSQLStored(ModelSQL):
+    'Model to test stored function'
+    __name__ = 'test.modelsql.stored'
+    factor = fields.Integer('Factor')
+    lines = fields.One2Many('test.modelsql.stored.line', 'parent', 'Lines')
+    total = fields.Function(fields.Integer('Total', depends=['factor',
+                'lines']), 'get_total', store=True)
+
+    def get_total(self, name):
+        return (self.factor or 0) * sum(l.value or 0 for l in self.lines)
+
+
+class ModelSQLStoredLine(ModelSQL):
+    'Model to test stored function line'
+    __name__ = 'test.modelsql.stored.line'
+    parent = fields.Many2One('test.modelsql.stored', 'Parent',
+        ondelete='CASCADE')
+    value = fields.Integer('Value')
+
+
 class Model4Union1(ModelSQL):
     'Model for union 1'
     __name__ = 'test.model.union1'
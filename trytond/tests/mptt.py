@@ -6,7 +6,7 @@ from sql import Null
 from trytond.model import ModelView, ModelSQL, fields
 
 __all__ = [
-    'MPTT',
+    'MPTT', 'Tree', 'TreeParent',
     ]
 
 
@@ -42,3 +42,25 @@ class MPTT(ModelSQL, ModelView):
     @staticmethod
     def default_right():
         return 0
+
+
+class Tree(ModelSQL):
+    'Tree'
+    __name__ = 'test.tree'
+    name = fields.Char('Name', required=True)
+    parent = fields.Many2One('test.tree', "Parent")
+    parents = fields.Many2Many('test.tree.parent', 'child', 'parent',
+        "Parents")
+
+    @classmethod
+    def validate(cls, records):
+        super(Tree, cls).validate(records)
+        cls.check_recursion(records)
+        cls.check_recursion(records, parent='parents')
+
+
+class TreeParent(ModelSQL):
+    'Tree Parent'
+    __name__ = 'test.tree.parent'
+    child = fields.Many2One('test.tree', "Child")
+    parent = fields.Many2One('test.tree', "Parent")
@@ -1,9 +1,22 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import os
+import json
+import shutil
+import tempfile
 import unittest
+from mock import patch
+from threading import Event
+from sql import Table
 
-from trytond.cache import freeze
+from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
+    install_module
+from trytond import backend
+from trytond.cache import freeze, Cache, LocalChannel, DatabaseChannel, \
+    SharedStore, fcntl
+from trytond.transaction import Transaction
+from trytond.config import config
 
 
 class CacheTestCase(unittest.TestCase):
@@ -32,9 +45,279 @@ class CacheTestCase(unittest.TestCase):
                                             ]))]))]))
 
 
+class CacheChannelTestCase(unittest.TestCase):
+    "Test Cache Channel"
+
+    def setUp(self):
+        install_module('tests')
+        self.cache = Cache('test.cache_channel', context=False)
+
+    def test0010local_channel(self):
+        "Test local channel"
+        channel = LocalChannel(DB_NAME)
+        with patch.dict(Cache._channels, {DB_NAME: channel}), \
+                Transaction().start(DB_NAME, USER, context=CONTEXT):
+            self.cache.set('foo', 'bar')
+            with patch.object(Transaction, 'new_cursor') as new_cursor:
+                Cache.clean(DB_NAME)
+                self.assertFalse(new_cursor.called)
+            self.assertEqual(self.cache.get('foo'), 'bar')
+
+            self.cache.clear()
+            # Filled by a concurrent transaction before the commit
+            self.cache.set('foo', 'bar')
+            Cache.resets(DB_NAME)
+            self.assertEqual(self.cache.get('foo'), None)
+
+    def test0020no_channel(self):
+        "Test polling without channel"
+        with patch.dict(Cache._channels, {DB_NAME: None}), \
+                Transaction().start(DB_NAME, USER, context=CONTEXT):
+            Cache.clean(DB_NAME)
+            self.cache.set('foo', 'bar')
+            self.cache.clear()
+            Cache.resets(DB_NAME)
+            self.cache.set('foo', 'bar')
+            Cache.clean(DB_NAME)
+            self.assertEqual(self.cache.get('foo'), None)
+
+    def test0030resets(self):
+        "Test resets"
+        table = Table('ir_cache')
+        with patch.dict(Cache._channels, {DB_NAME: None}), \
+                Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            cursor = transaction.cursor
+            Cache.reset(DB_NAME, 'test.cache_channel')
+            Cache.resets(DB_NAME, cursor)
+            cursor.execute(*table.select(table.timestamp,
+                    where=table.name == 'test.cache_channel'))
+            timestamp, = cursor.fetchone()
+
+            Cache.reset(DB_NAME, 'test.cache_channel')
+            Cache.reset(DB_NAME, 'test.cache_resets')
+            Cache.resets(DB_NAME, cursor)
+            cursor.execute(*table.select(table.name, table.timestamp,
+                    where=table.name.in_(
+                        ['test.cache_channel', 'test.cache_resets'])))
+            timestamps = dict(cursor.fetchall())
+            self.assertEqual(len(timestamps), 2)
+            self.assertGreater(timestamps['test.cache_channel'], timestamp)
+            self.assertFalse(Cache._resets[DB_NAME])
+
+    def test0040context_keys(self):
+        "Test context keys"
+        cache = Cache('test.cache_context_keys', context=['language'])
+        with Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            with transaction.set_context(language='fr_FR'):
+                cache.set('foo', 'fr')
+            with transaction.set_context(language='en_US'):
+                cache.set('foo', 'en')
+            with transaction.set_context(language='fr_FR', bar=1):
+                self.assertEqual(cache.get('foo'), 'fr')
+            with transaction.set_user(0), \
+                    transaction.set_context(language='fr_FR'):
+                self.assertEqual(cache.get('foo'), None)
+
+    def test0050database_channel(self):
+        "Test database channel"
+        Database = backend.get('Database')
+        other = Cache('test.cache_channel_other', context=False)
+        channel = DatabaseChannel(DB_NAME)
+
+        def listen(*payloads):
+            with patch.object(Database, 'listen',
+                    lambda self, name: iter(payloads)):
+                channel._listen(ready)
+
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            ready = Event()
+            self.cache.set('foo', 'bar')
+            other.set('foo', 'bar')
+            listen(None, json.dumps(['test.cache_channel']))
+            self.assertTrue(ready.is_set())
+            self.assertEqual(self.cache.get('foo'), None)
+            self.assertEqual(other.get('foo'), 'bar')
+
+            # All the caches are cleared after a reconnection
+            listen(None)
+            self.assertEqual(other.get('foo'), None)
+
+
+class CacheStatisticsTestCase(unittest.TestCase):
+    "Test Cache Statistics"
+
+    def setUp(self):
+        install_module('tests')
+
+    def test0010cache(self):
+        "Test cache statistics"
+        cache = Cache('test.cache_statistics', size_limit=1, context=False)
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            self.assertEqual(cache.get('foo', False), False)
+            cache.set('foo', None)
+            self.assertEqual(cache.get('foo', False), None)
+            cache.set('bar', 1)
+            cache.clear()
+
+            statistics = Cache.get_statistics(DB_NAME)
+        self.assertEqual(statistics['test.cache_statistics'], {
+                'hit': 1,
+                'miss': 1,
+                'set': 2,
+                'eviction': 1,
+                'clear': 1,
+                'size': 0,
+                'size_limit': 1,
+                })
+
+    def test0020record(self):
+        "Test record cache statistics"
+        with Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            Cursor = transaction.cursor.__class__
+            User = POOL.get('res.user')
+            before = Cursor.get_statistics(DB_NAME).get('res.user',
+                {'hit': 0, 'miss': 0})
+            user, = User.search([('id', '=', USER)])
+            user.login
+            User(USER).login
+            after = Cursor.get_statistics(DB_NAME)['res.user']
+        self.assertGreater(after['hit'], before['hit'])
+
+
+@unittest.skipIf(fcntl is None, 'requires fcntl')
+class SharedStoreTestCase(unittest.TestCase):
+    "Test Shared Store"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        address = os.path.join(cls.directory, 'cache')
+        cls.patcher = patch.object(SharedStore, 'address',
+            staticmethod(lambda: address))
+        cls.patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        SharedStore._local.conn.close()
+        SharedStore._local.conn = None
+        SharedStore.stop()
+        cls.patcher.stop()
+        shutil.rmtree(cls.directory)
+
+    def test0010share(self):
+        "Test share entries"
+        # Each store stands for the same cache in a different process
+        store1 = SharedStore('test.shared', 2)
+        store2 = SharedStore('test.shared', 2)
+        store3 = SharedStore('test.shared', 2)
+
+        store1.set('db', 'foo', {'bar': [1, 2]})
+        self.assertEqual(store2.get('db', 'foo'), {'bar': [1, 2]})
+        self.assertEqual(store2.get('other db', 'foo'), None)
+
+        store2.clear('db')
+        self.assertEqual(store3.get('db', 'foo'), None)
+
+    def test0020eviction(self):
+        "Test eviction of entries"
+        store1 = SharedStore('test.eviction', 2)
+        store2 = SharedStore('test.eviction', 2)
+
+        for key in ['a', 'b', 'c']:
+            store1.set('db', key, key)
+        self.assertEqual(store2.get('db', 'a'), None)
+        self.assertEqual(store2.get('db', 'c'), 'c')
+
+    def test0030unpicklable(self):
+        "Test unpicklable value"
+        store1 = SharedStore('test.unpicklable', 2)
+        store2 = SharedStore('test.unpicklable', 2)
+        value = lambda: None
+
+        store1.set('db', 'foo', value)
+        self.assertEqual(store1.get('db', 'foo'), value)
+        self.assertEqual(store2.get('db', 'foo'), None)
+
+    def test0040same_name(self):
+        "Test caches with the same name and different sizes"
+        store1 = SharedStore('test.same_name', 1)
+        store2 = SharedStore('test.same_name', 2)
+        other1 = SharedStore('test.same_name', 1)
+        other2 = SharedStore('test.same_name', 2)
+
+        store1.set('db', 'foo', 1)
+        store2.set('db', 'bar', 2)
+        self.assertEqual(other1.get('db', 'foo'), 1)
+        self.assertEqual(other2.get('db', 'bar'), 2)
+
+    def test0050private(self):
+        "Test refuse key not private"
+        address = os.path.join(self.directory, 'public')
+        with open(address + '.key', 'wb') as key_file:
+            key_file.write('key')
+        os.chmod(address + '.key', 0644)
+        self.assertRaises(IOError, SharedStore.authkey, address)
+
+        os.chmod(address + '.key', 0600)
+        self.assertEqual(SharedStore.authkey(address), 'key')
+
+
+class TranslationPreloadTestCase(unittest.TestCase):
+    "Test Translation Preload"
+
+    def setUp(self):
+        install_module('tests')
+        config.set('cache', 'translation_preload', 'True')
+
+    def tearDown(self):
+        config.set('cache', 'translation_preload', 'False')
+
+    def test0010preload(self):
+        "Test preload of translations"
+        Translation = POOL.get('ir.translation')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            cursor = transaction.cursor
+            table = Translation.__table__()
+            cursor.execute(*table.insert([
+                        table.name, table.lang, table.type, table.res_id,
+                        table.src, table.src_md5, table.value, table.fuzzy,
+                        ], [[
+                            'test.preload,foo', 'fr_FR', 'field', -1,
+                            'Foo', Translation.get_src_md5('Foo'), 'Fou',
+                            False,
+                            ]]))
+            Translation._translation_preload_cache.clear()
+
+            self.assertEqual(Translation.get_source(
+                    'test.preload,foo', 'field', 'fr_FR', 'Foo'), 'Fou')
+
+            # The snapshot is used without query
+            cursor.execute(*table.delete(
+                    where=table.name == 'test.preload,foo'))
+            self.assertEqual(Translation.get_source(
+                    'test.preload,foo', 'field', 'fr_FR'), 'Fou')
+            self.assertEqual(Translation.get_sources([
+                        ('test.preload,foo', 'field', 'fr_FR', 'Foo'),
+                        ('test.preload,bar', 'field', 'fr_FR', None),
+                        ]), {
+                    ('test.preload,foo', 'field', 'fr_FR', 'Foo'): 'Fou',
+                    ('test.preload,bar', 'field', 'fr_FR', None): None,
+                    })
+
+            Translation._translation_preload_cache.clear()
+            self.assertEqual(Translation.get_source(
+                    'test.preload,foo', 'field', 'fr_FR', 'Foo'), None)
+
+
 def suite():
     func = unittest.TestLoader().loadTestsFromTestCase
     suite = unittest.TestSuite()
-    for testcase in (CacheTestCase,):
+    for testcase in (CacheTestCase, CacheChannelTestCase,
+            CacheStatisticsTestCase, SharedStoreTestCase,
+            TranslationPreloadTestCase):
         suite.addTests(func(testcase))
     return suite
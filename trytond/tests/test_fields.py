@@ -12,6 +12,7 @@ except ImportError:
 import unittest
 import datetime
 from decimal import Decimal
+from mock import patch
 from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
         install_module
 from trytond.transaction import Transaction
@@ -2487,6 +2488,36 @@ class FieldsTestCase(unittest.TestCase):
 
             transaction.cursor.rollback()
 
+    def test0121one2many_get(self):
+        'Test One2Many get without instantiating the targets'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            for one2many, one2many_target in (
+                    (self.one2many, self.one2many_target),
+                    (self.one2many_reference, self.one2many_reference_target),
+                    ):
+                origin1, origin2 = one2many.create([{
+                            'name': 'origin1',
+                            'targets': [('create', [
+                                        {'name': 'target1'},
+                                        {'name': 'target2'},
+                                        ])],
+                            }, {
+                            'name': 'origin2',
+                            }])
+                target_ids = [t.id for t in origin1.targets]
+
+                with patch.object(one2many_target, 'browse') as browse:
+                    result = one2many.read([origin1.id, origin2.id],
+                        ['targets'])
+                    self.assertFalse(browse.called)
+                self.assertEqual(sorted(result), [
+                        {'id': origin1.id, 'targets': tuple(target_ids)},
+                        {'id': origin2.id, 'targets': ()},
+                        ])
+
+            transaction.cursor.rollback()
+
     def test0130many2many(self):
         'Test Many2Many'
         with Transaction().start(DB_NAME, USER,
@@ -2670,6 +2701,33 @@ class FieldsTestCase(unittest.TestCase):
 
             transaction.cursor.rollback()
 
+    def test0131many2many_get(self):
+        'Test Many2Many get without instantiating the relations'
+        Relation = POOL.get('test.many2many.relation')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            target1, target2 = self.many2many_target.create([
+                    {'name': 'target1'},
+                    {'name': 'target2'},
+                    ])
+            origin1, origin2 = self.many2many.create([{
+                        'name': 'origin1',
+                        'targets': [('add', [target2.id, target1.id])],
+                        }, {
+                        'name': 'origin2',
+                        }])
+
+            with patch.object(Relation, 'browse') as browse:
+                result = self.many2many.read([origin1.id, origin2.id],
+                    ['targets'])
+                self.assertFalse(browse.called)
+            self.assertEqual(sorted(result), [
+                    {'id': origin1.id, 'targets': (target1.id, target2.id)},
+                    {'id': origin2.id, 'targets': ()},
+                    ])
+
+            transaction.cursor.rollback()
+
     def test0140reference(self):
         'Test Reference'
         with Transaction().start(DB_NAME, USER,
@@ -3196,6 +3254,8 @@ class FieldsTestCase(unittest.TestCase):
                 bin1_size = self.binary(bin1.id)
                 self.assert_(bin1_size.binary == len('bar'))
                 self.assert_(bin1_size.binary != buffer('bar'))
+                self.assertEqual(transaction.context['test.binary.binary'],
+                    'size')
 
             bin2, = self.binary.create([{}])
             self.assert_(bin2.binary is None)
@@ -6,6 +6,7 @@ import datetime
 from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
         install_module
 from trytond.transaction import Transaction
+from trytond.model.fields.field import search_table
 from trytond.exceptions import UserError
 from trytond import backend
 
@@ -76,6 +77,42 @@ class HistoryTestCase(unittest.TestCase):
             with Transaction().set_context(_datetime=datetime.datetime.min):
                 self.assertRaises(UserError, History.read, [history_id])
 
+    def test0015read_many(self):
+        'Test read history of many records'
+        History = POOL.get('test.history')
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            histories = History.create([{'value': i} for i in range(3)])
+            first = max(h.create_date for h in histories)
+
+            transaction.cursor.commit()
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            History.write(histories[:2], {'value': 10})
+            History.delete(histories[2:])
+
+            transaction.cursor.commit()
+
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            ids = [h.id for h in histories]
+            with Transaction().set_context(_datetime=first):
+                result = History.read(ids, ['value'])
+                self.assertEqual(sorted(r['value'] for r in result),
+                    [0, 1, 2])
+                self.assertEqual(History.search([
+                            ('value', '=', 1),
+                            ]), [History(ids[1])])
+
+            with Transaction().set_context(_datetime=datetime.datetime.max):
+                result = History.read(ids[:2], ['value'])
+                self.assertEqual([r['value'] for r in result], [10, 10])
+                self.assertEqual(History.search([
+                            ('value', 'in', [1, 2, 10]),
+                            ], order=[('id', 'ASC')]),
+                    [History(i) for i in ids[:2]])
+
     @unittest.skipIf(backend.name() in ('sqlite', 'mysql'),
         'now() is not the start of the transaction')
     def test0020read_same_timestamp(self):
@@ -306,6 +343,9 @@ class HistoryTestCase(unittest.TestCase):
                 with Transaction().set_context(_datetime=timestamp):
                     records = History.search([], order=order)
                     self.assertEqual(records, instances)
+                    records = sum(History.search_iter([], order=order,
+                            batch_size=1), [])
+                    self.assertEqual(records, instances)
 
         with Transaction().start(DB_NAME, USER,
                 context=CONTEXT) as transaction:
@@ -329,6 +369,9 @@ class HistoryTestCase(unittest.TestCase):
                         from_test=True):
                     records = History.search([], order=order)
                     self.assertEqual(records, instances)
+                    records = sum(History.search_iter([], order=order,
+                            batch_size=1), [])
+                    self.assertEqual(records, instances)
 
     @unittest.skipIf(backend.name() in ('sqlite', 'mysql'),
         'now() is not the start of the transaction')
@@ -361,6 +404,9 @@ class HistoryTestCase(unittest.TestCase):
                         last_test=True):
                     records = History.search([], order=order)
                     self.assertEqual(records, instances)
+                    records = sum(History.search_iter([], order=order,
+                            batch_size=1), [])
+                    self.assertEqual(records, instances)
                     self.assertEqual([x.value for x in records], values)
 
     def test0070_browse(self):
@@ -416,6 +462,52 @@ class HistoryTestCase(unittest.TestCase):
             self.assertEqual(history.value, 2)
             self.assertEqual([l.name for l in history.lines], ['c'])
 
+            # The lines are not selected from their table but the history
+            with Transaction().set_context(_datetime=first_stamp):
+                query = Line.search([], query=True)
+                self.assertIsNone(search_table(Line, query))
+                self.assertEqual(History.read([history_id], ['lines']), [{
+                            'id': history_id,
+                            'lines': (line_a_id, line_b_id),
+                            }])
+
+    def test0080read_datetime_field(self):
+        'Test read of datetime_field'
+        History = POOL.get('test.history')
+        Line = POOL.get('test.history.line')
+        Datetime = POOL.get('test.history.datetime')
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            history = History(value=1)
+            history.save()
+            Line.create([{'history': history.id, 'name': 'a'}])
+            first = history.create_date
+
+            transaction.cursor.commit()
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            history = History(history.id)
+            history.value = 2
+            history.save()
+            second = history.write_date
+
+            transaction.cursor.commit()
+
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            records = Datetime.create([
+                    {'stamp': first, 'history': history.id},
+                    {'stamp': second, 'history': history.id},
+                    {'stamp': first, 'history': history.id},
+                    ])
+            del Datetime.calls[:]
+            result = Datetime.read([r.id for r in records],
+                ['history.value', 'lines'])
+            values = dict((r['id'], r['history.value']) for r in result)
+            self.assertEqual([values[r.id] for r in records], [1, 2, 1])
+            self.assertEqual(sorted(Datetime.calls), sorted([first, second]))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(HistoryTestCase)
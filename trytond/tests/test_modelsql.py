@@ -4,8 +4,11 @@
 
 import unittest
 import time
+import sqlite3
+from mock import patch
 
 from trytond import backend
+from trytond.model import fields
 from trytond.exceptions import UserError, ConcurrencyException
 from trytond.transaction import Transaction
 from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
@@ -19,6 +22,7 @@ class ModelSQLTestCase(unittest.TestCase):
         install_module('tests')
         self.modelsql = POOL.get('test.modelsql')
         self.modelsql_timestamp = POOL.get('test.modelsql.timestamp')
+        self.modelsql_record_cache = POOL.get('test.modelsql.record_cache')
 
     @unittest.skipIf(backend.name() == 'sqlite',
         'SQLite not concerned because tryton don\'t set "NOT NULL"'
@@ -76,6 +80,557 @@ class ModelSQLTestCase(unittest.TestCase):
             self.modelsql_timestamp.delete([record])
             cursor.commit()
 
+    def test0030record_cache(self):
+        'Test record cache'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            record, = self.modelsql_record_cache.create([{'name': 'foo'}])
+            cursor.commit()
+        table = self.modelsql_record_cache.__table__()
+
+        def read_name():
+            with Transaction().start(DB_NAME, USER, context=CONTEXT):
+                row, = self.modelsql_record_cache.read([record.id], ['name'])
+                return row['name']
+
+        def update_name(name):
+            with Transaction().start(DB_NAME, USER,
+                    context=CONTEXT) as transaction:
+                cursor = transaction.cursor
+                cursor.execute(*table.update([table.name], [name],
+                        where=table.id == record.id))
+                cursor.commit()
+
+        self.assertEqual(read_name(), 'foo')
+
+        # The row is served from the cache
+        update_name('bar')
+        self.assertEqual(read_name(), 'foo')
+
+        # Missing columns are read from the database
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            row, = self.modelsql_record_cache.read([record.id],
+                ['name', 'create_uid'])
+            self.assertEqual(row['name'], 'bar')
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            self.modelsql_record_cache.write([record], {'name': 'baz'})
+            row, = self.modelsql_record_cache.read([record.id], ['name'])
+            self.assertEqual(row['name'], 'baz')
+            cursor.rollback()
+        # The cache is not filled by a modifying transaction
+        self.assertEqual(read_name(), 'bar')
+
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            self.modelsql_record_cache.write([record], {'name': 'baz'})
+            cursor.commit()
+        self.assertEqual(read_name(), 'baz')
+
+        # The language is part of the key
+        update_name('qux')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            with Transaction().set_context(language='fr_FR'):
+                row, = self.modelsql_record_cache.read([record.id], ['name'])
+            self.assertEqual(row['name'], 'qux')
+        self.assertEqual(read_name(), 'baz')
+
+        # A transaction started before a clear does not fill the cache
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            self.modelsql_record_cache._clear_record_cache()
+            row, = self.modelsql_record_cache.read([record.id], ['name'])
+            self.assertEqual(row['name'], 'qux')
+        update_name('quux')
+        self.assertEqual(read_name(), 'quux')
+
+        # The translations modified directly clear the record cache
+        Translation = POOL.get('ir.translation')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT), \
+                patch.object(self.modelsql_record_cache,
+                    '_clear_record_cache') as clear:
+            translation, = Translation.create([{
+                        'name': 'test.modelsql.record_cache,name',
+                        'type': 'model',
+                        'lang': 'fr_FR',
+                        'res_id': record.id,
+                        'src': 'quux',
+                        'value': 'corge',
+                        }])
+            Translation.write([translation], {'value': 'grault'})
+            Translation.delete([translation])
+            self.assertEqual(clear.call_count, 3)
+
+    def test0040create_batch(self):
+        'Test create of records with different columns'
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            names = [str(i) if i % 100 else None for i in range(500)]
+            records = self.modelsql_record_cache.create(
+                [{'name': n} if n else {} for n in names])
+            self.assertEqual([r.id for r in records],
+                sorted(set(r.id for r in records)))
+            self.assertEqual([r.name for r in records], names)
+
+    def test0050create_default(self):
+        'Test create with record independent default'
+        Default = POOL.get('test.modelsql.default')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            del Default.calls[:]
+            records = Default.create([{}, {}, {'independent': 0}])
+            self.assertEqual(Default.calls,
+                ['independent', 'dependent', 'dependent', 'dependent'])
+            self.assertEqual([r.independent for r in records], [1, 1, 0])
+            self.assertEqual([r.dependent for r in records], [2, 3, 4])
+
+        # The decorator can be applied on the classmethod
+        default = fields.record_independent(
+            classmethod(lambda cls: None)).__get__(None, Default)
+        self.assertTrue(default.record_independent)
+
+    def test0060rule(self):
+        'Test rule on create, write and delete'
+        Default = POOL.get('test.modelsql.default')
+        RuleGroup = POOL.get('ir.rule.group')
+        Model = POOL.get('ir.model')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            model, = Model.search([('model', '=', 'test.modelsql.default')])
+            rule_group, = RuleGroup.create([{
+                        'model': model.id,
+                        'global_p': True,
+                        'perm_read': False,
+                        'rules': [('create', [{
+                                        'domain': (
+                                            "[('independent', '!=', 0)]"),
+                                        }])],
+                        }])
+            allowed, denied = Default.create([
+                    {'independent': 1}, {'independent': 2}])
+            Default.write([denied], {'independent': 0})
+
+            Default.write([allowed], {'dependent': 0})
+            with self.assertRaises(UserError) as cm:
+                Default.write([allowed, denied], {'dependent': 0})
+            self.assertIn('access rule', cm.exception.message)
+            with self.assertRaises(UserError) as cm:
+                Default.write([Default(denied.id + 1)], {'dependent': 0})
+            self.assertIn("don't exist", cm.exception.message)
+
+            with self.assertRaises(UserError) as cm:
+                Default.delete([denied])
+            self.assertIn('access rule', cm.exception.message)
+            Default.delete([allowed])
+            self.assertEqual(Default.search([('id', '=', allowed.id)]), [])
+
+            self.assertRaises(UserError, Default.create,
+                [{'independent': 0}])
+
+            # Clear the cache of the rules
+            RuleGroup.delete([rule_group])
+
+    def test0061rule_without_rowcount(self):
+        'Test rule on write without rowcount'
+        Default = POOL.get('test.modelsql.default')
+        RuleGroup = POOL.get('ir.rule.group')
+        Model = POOL.get('ir.model')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            model, = Model.search([('model', '=', 'test.modelsql.default')])
+            rule_group, = RuleGroup.create([{
+                        'model': model.id,
+                        'global_p': True,
+                        'perm_read': False,
+                        'rules': [('create', [{
+                                        'domain': (
+                                            "[('independent', '!=', 0)]"),
+                                        }])],
+                        }])
+            allowed, denied = Default.create([
+                    {'independent': 1}, {'independent': 2}])
+            Default.write([denied], {'independent': 0})
+
+            with patch.object(cursor, 'has_rowcount', return_value=False), \
+                    patch.object(cursor, 'execute',
+                        wraps=cursor.execute) as execute:
+                Default.write([allowed], {'dependent': 0})
+                updates = [c[0][0] for c in execute.call_args_list
+                    if c[0][0].startswith('UPDATE')]
+                self.assertTrue(updates)
+                for update in updates:
+                    self.assertNotIn('independent', update)
+
+                with self.assertRaises(UserError) as cm:
+                    Default.write([allowed, denied], {'dependent': 0})
+                self.assertIn('access rule', cm.exception.message)
+
+            # Clear the cache of the rules
+            RuleGroup.delete([rule_group])
+
+    def test0065rule_inline(self):
+        'Test rule compiled in the where clause'
+        Default = POOL.get('test.modelsql.default')
+        Rule = POOL.get('ir.rule')
+        RuleGroup = POOL.get('ir.rule.group')
+        Model = POOL.get('ir.model')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            model, = Model.search([('model', '=', 'test.modelsql.default')])
+            rule_group, = RuleGroup.create([{
+                        'model': model.id,
+                        'global_p': True,
+                        'rules': [('create', [{
+                                        'domain': (
+                                            "[('independent', '!=', 0)]"),
+                                        }])],
+                        }])
+            allowed, denied = Default.create([
+                    {'independent': 1}, {'independent': 2}])
+            Default.write([denied], {'independent': 0})
+
+            table = Default.__table__()
+            domain = Rule.domain_get(Default.__name__, mode='read',
+                table=table)
+            self.assertNotIn('SELECT', str(domain))
+
+            self.assertEqual(Default.search([
+                        ('id', 'in', [allowed.id, denied.id]),
+                        ]), [allowed])
+            self.assertEqual(Default.read([allowed.id], ['independent']),
+                [{'id': allowed.id, 'independent': 1}])
+            self.assertRaises(UserError, Default.read, [denied.id],
+                ['independent'])
+
+            # Clear the cache of the rules
+            RuleGroup.delete([rule_group])
+
+    def test0066rule_cache_key(self):
+        'Test rule cache key shared by users'
+        Rule = POOL.get('ir.rule')
+        RuleGroup = POOL.get('ir.rule.group')
+        Model = POOL.get('ir.model')
+        User = POOL.get('res.user')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            model, = Model.search([('model', '=', 'test.modelsql.default')])
+            rule_group, = RuleGroup.create([{
+                        'model': model.id,
+                        'global_p': True,
+                        'rules': [('create', [{
+                                        'domain': (
+                                            "[('independent', 'in', "
+                                            "[g.id for g in user.groups])]"),
+                                        'user_fields': 'groups',
+                                        }])],
+                        }])
+            user1, user2 = User.create([
+                    {'name': 'User 1', 'login': 'user1'},
+                    {'name': 'User 2', 'login': 'user2'},
+                    ])
+
+            def get_key(user):
+                with Transaction().set_user(user.id):
+                    return Rule._get_user_key(
+                        'test.modelsql.default', 'read')
+            self.assertEqual(get_key(user1), get_key(user2))
+
+            # The second user adds no entry to the cache of the domains
+            Rule._domain_get_cache.clear()
+            sizes = []
+            for user in [user1, user2]:
+                with Transaction().set_user(user.id):
+                    Rule.domain_get('test.modelsql.default')
+                sizes.append(Rule._domain_get_cache.store.size(
+                        transaction.cursor.dbname))
+            self.assertEqual(sizes[0], sizes[1])
+
+            rule, = rule_group.rules
+            Rule.write([rule], {'user_fields': None})
+            self.assertNotEqual(get_key(user1), get_key(user2))
+
+            self.assertRaises(UserError, Rule.write, [rule], {
+                    'user_fields': 'foo',
+                    })
+
+            # Other names of the context depend on the user
+            with patch.object(Rule, '_get_context', staticmethod(
+                        lambda: {'user': None, 'employee': None})):
+                Rule.write([rule], {
+                        'domain': "[('independent', '=', employee)]",
+                        'user_fields': 'groups',
+                        })
+                self.assertNotEqual(get_key(user1), get_key(user2))
+
+            # Clear the cache of the rules
+            RuleGroup.delete([rule_group])
+
+    def test0070references(self):
+        'Test references of the pool'
+        Target = POOL.get('test.many2one_target')
+        Model = POOL.get('test.many2one_domainvalidation')
+        self.assertEqual(POOL.references(Target.__name__),
+            [(Model, 'many2one')])
+        self.assertEqual(POOL.references('test.modelsql.default'), [])
+
+        # The index is rebuilt when models are added
+        POOL.add(Model)
+        self.assertEqual(POOL.references(Target.__name__),
+            [(Model, 'many2one')])
+
+    def test0080delete_cascade(self):
+        'Test delete cascade'
+        Parent = POOL.get('test.modelsql.cascade')
+        Child = POOL.get('test.modelsql.cascade.child')
+        GrandChild = POOL.get('test.modelsql.cascade.grandchild')
+        Restrict = POOL.get('test.modelsql.cascade.restrict')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            self.assertTrue(Child._ModelSQL__can_delete_cascade())
+
+            parent, other = Parent.create([{
+                        'children': [('create', [{
+                                        'children': [('create', [{}])],
+                                        }, {}])],
+                        }, {
+                        'children': [('create', [{
+                                        'children': [('create', [{}])],
+                                        }])],
+                        }])
+            child_ids = set(c.id for c in parent.children)
+            grandchild_ids = set(c.id for c in parent.children[0].children)
+            Parent.delete([parent])
+            self.assertEqual(Child.search([]), list(other.children))
+            self.assertEqual(GrandChild.search([]),
+                list(other.children[0].children))
+            for name, ids in [
+                    (Child.__name__, child_ids),
+                    (GrandChild.__name__, grandchild_ids),
+                    ]:
+                self.assertEqual(transaction.delete[name], ids)
+                self.assertEqual(transaction.delete_records[name], ids)
+
+            Restrict.create([{'child': other.children[0].id}])
+            self.assertRaises(UserError, Parent.delete, [other])
+
+    def test0090search_many(self):
+        'Test search returning more rows than IN_MAX'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            records = self.modelsql_record_cache.create(
+                [{'name': str(i)} for i in range(cursor.IN_MAX * 2 + 1)])
+            result = self.modelsql_record_cache.search([
+                    ('id', 'in', [r.id for r in records]),
+                    ], order=[('id', 'DESC')])
+            self.assertEqual(result, records[::-1])
+
+            cache = cursor.get_cache()[self.modelsql_record_cache.__name__]
+            self.assertIn(records[-1].id, cache)
+            self.assertNotIn(records[0].id, cache)
+
+    def test0100search_iter(self):
+        'Test search_iter'
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            names = ['b', 'a', None, 'b', 'c', None, 'a']
+            records = self.modelsql_record_cache.create(
+                [{'name': n} for n in names])
+            domain = [('id', 'in', [r.id for r in records])]
+
+            for otype in ['ASC', 'DESC']:
+                batches = list(self.modelsql_record_cache.search_iter(domain,
+                        order=[('name', otype)], batch_size=3))
+                self.assertEqual([len(b) for b in batches], [3, 3, 1])
+                result = sum(batches, [])
+                # NULL values come last and the id breaks the ties
+                expected = sorted(records, key=lambda r: r.id)
+                expected = sorted((r for r in expected if r.name),
+                    key=lambda r: r.name, reverse=otype == 'DESC')
+                expected += [r for r in records if r.name is None]
+                self.assertEqual(result, expected)
+
+            self.assertEqual(
+                list(self.modelsql_record_cache.search_iter(
+                        [('id', '=', -1)])), [])
+
+    def test0110read_related(self):
+        'Test read of related fields'
+        Read = POOL.get('test.modelsql.read')
+        Target = POOL.get('test.modelsql.read.target')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            target, = Target.create([{'name': 'Foo', 'code': 'F'}])
+            record1, record2 = Read.create([{'target': target.id}, {}])
+
+            # Joined
+            result = Read.read([record1.id, record2.id],
+                ['target.name', 'target.code'])
+            result.sort(key=lambda r: r['id'])
+            self.assertEqual(result, [{
+                        'id': record1.id,
+                        'target.name': 'Foo',
+                        'target.code': 'F',
+                        }, {
+                        'id': record2.id,
+                        'target.name': None,
+                        'target.code': None,
+                        }])
+
+            # Read by the target
+            result = Read.read([record1.id, record2.id],
+                ['target.name', 'target.rec_name'])
+            result.sort(key=lambda r: r['id'])
+            self.assertEqual(result, [{
+                        'id': record1.id,
+                        'target.name': 'Foo',
+                        'target.rec_name': 'Foo',
+                        }, {
+                        'id': record2.id,
+                        'target.name': None,
+                        'target.rec_name': None,
+                        }])
+
+            result = Read.read([record1.id], ['target', 'target.id'])
+            self.assertEqual(result, [{
+                        'id': record1.id,
+                        'target': target.id,
+                        'target.id': target.id,
+                        }])
+
+    def test0120stored_function(self):
+        'Test stored function'
+        Stored = POOL.get('test.modelsql.stored')
+        Line = POOL.get('test.modelsql.stored.line')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            cursor = transaction.cursor
+            table = Stored.__table__()
+
+            def stored_total(record):
+                cursor.execute(*table.select(table.total,
+                        where=table.id == record.id))
+                return cursor.fetchone()[0]
+
+            record1, record2 = Stored.create([{
+                        'factor': 2,
+                        'lines': [('create', [{'value': 1}, {'value': 2}])],
+                        }, {
+                        'factor': 1,
+                        }])
+            self.assertEqual(stored_total(record1), 6)
+            self.assertEqual(stored_total(record2), 0)
+
+            Stored.write([record2], {'factor': 3})
+            line, = Line.create([{'parent': record2.id, 'value': 4}])
+            self.assertEqual(stored_total(record2), 12)
+
+            Line.write([line], {'parent': record1.id})
+            self.assertEqual(stored_total(record1), 14)
+            self.assertEqual(stored_total(record2), 0)
+
+            Line.delete([line])
+            self.assertEqual(stored_total(record1), 6)
+
+            self.assertEqual(Stored.search([('total', '>', 1)]), [record1])
+            self.assertEqual(Stored.search([
+                        ('id', 'in', [record1.id, record2.id]),
+                        ], order=[('total', 'DESC')]), [record1, record2])
+            self.assertEqual(Stored.read([record1.id], ['total']),
+                [{'id': record1.id, 'total': 6}])
+
+            Stored.delete([record1])
+
+    @unittest.skipIf(backend.name() == 'sqlite'
+        and sqlite3.sqlite_version_info < (3, 35, 0),
+        'SQLite supports DROP COLUMN since 3.35')
+    def test0125stored_function_register(self):
+        'Test stored function computed on existing records at register'
+        Stored = POOL.get('test.modelsql.stored')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT) \
+                as transaction:
+            cursor = transaction.cursor
+            table = Stored.__table__()
+            record, = Stored.create([{
+                        'factor': 2,
+                        'lines': [('create', [{'value': 3}])],
+                        }])
+
+            cursor.execute('ALTER TABLE "%s" DROP COLUMN "total"'
+                % Stored._table)
+            with transaction.set_user(0):
+                Stored.__register__('tests')
+
+            cursor.execute(*table.select(table.total,
+                    where=table.id == record.id))
+            self.assertEqual(cursor.fetchone()[0], 6)
+
+            # The schema change may be already committed
+            Stored.delete([record])
+            transaction.cursor.commit()
+
+    def test0130read_translation(self):
+        'Test read and search of translated field'
+        Translate = POOL.get('test.char_translate')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            record1, record2 = Translate.create([
+                    {'char': 'Foo'}, {'char': 'Bar'}])
+            with Transaction().set_context(language='fr_FR'):
+                Translate.write([record1], {'char': 'Baz'})
+                Translate.write([record2], {'char': ''})
+
+            ids = [record1.id, record2.id]
+            for language, values in [
+                    ('en_US', ['Foo', 'Bar']),
+                    ('fr_FR', ['Baz', 'Bar']),
+                    ]:
+                with Transaction().set_context(language=language):
+                    result = Translate.read(ids, ['char'])
+                    result = dict((r['id'], r['char']) for r in result)
+                    self.assertEqual([result[i] for i in ids], values)
+
+                    self.assertEqual(Translate.search([
+                                ('id', 'in', ids),
+                                ('char', '=', values[0]),
+                                ]), [record1])
+                    self.assertEqual(Translate.search([
+                                ('id', 'in', ids),
+                                ], order=[('char', 'ASC')]),
+                        sorted([record1, record2],
+                            key=lambda r: values[ids.index(r.id)]))
+
+    def test0140set_translation(self):
+        'Test set translations'
+        Translate = POOL.get('test.char_translate')
+        Translation = POOL.get('ir.translation')
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            records = Translate.create([{'char': 'Foo'}, {'char': 'Bar'}])
+            ids = [r.id for r in records]
+            name = 'test.char_translate,char'
+
+            def translations(lang):
+                result = Translation.search([
+                        ('lang', '=', lang),
+                        ('name', '=', name),
+                        ('res_id', 'in', ids),
+                        ])
+                return dict((t.res_id, (t.value, t.src, bool(t.fuzzy)))
+                    for t in result)
+
+            with Transaction().set_context(language='fr_FR'):
+                Translate.write(records[:1], {'char': 'Baz'})
+                Translate.write(records, {'char': 'Qux'})
+            self.assertEqual(translations('fr_FR'), {
+                    ids[0]: ('Qux', 'Foo', False),
+                    ids[1]: ('Qux', 'Bar', False),
+                    })
+
+            Translate.write(records[:1], {'char': 'Quux'})
+            self.assertEqual(translations('fr_FR'), {
+                    ids[0]: ('Qux', 'Quux', True),
+                    ids[1]: ('Qux', 'Bar', False),
+                    })
+            self.assertEqual(translations('en_US')[ids[0]],
+                ('Quux', 'Quux', False))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(ModelSQLTestCase)
@@ -7,6 +7,7 @@ from mock import patch
 from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
         install_module
 from trytond.transaction import Transaction
+from trytond.exceptions import UserError
 
 
 class MPTTTestCase(unittest.TestCase):
@@ -181,6 +182,81 @@ class MPTTTestCase(unittest.TestCase):
 
                 self.assertTrue(mock.called)
 
+    def test0070rebuild_tree(self):
+        'Test rebuild tree updates only the modified nodes'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            cursor = transaction.cursor
+            self.mptt._rebuild_tree('parent', None, 0)
+            self.CheckTree()
+
+            records = self.mptt.search([('parent', '=', None)])
+            self.mptt.write(list(records[0].childs), {
+                    'parent': records[1].id,
+                    })
+            self.mptt._rebuild_tree('parent', None, 0)
+            self.CheckTree()
+
+            with patch.object(cursor, 'execute',
+                    wraps=cursor.execute) as execute:
+                self.mptt._rebuild_tree('parent', None, 0)
+                # Only the select as the tree is already up to date
+                self.assertEqual(execute.call_count, 1)
+
+            transaction.cursor.rollback()
+
+    def test0080child_of(self):
+        'Test child_of without left and right'
+        Tree = POOL.get('test.tree')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            root, = Tree.create([{'name': 'Root'}])
+            child, = Tree.create([{'name': 'Child', 'parent': root.id}])
+            grandchild, = Tree.create([{
+                        'name': 'Grandchild',
+                        'parent': child.id,
+                        'parents': [('add', [root.id, child.id])],
+                        }])
+            other, = Tree.create([{'name': 'Other'}])
+
+            for field in ['parent', 'parents']:
+                self.assertEqual(Tree.search([
+                            (field, 'child_of', [child.id]),
+                            ], order=[('id', 'ASC')]),
+                    [child, grandchild])
+                self.assertEqual(Tree.search([
+                            (field, 'not child_of', [child.id]),
+                            ], order=[('id', 'ASC')]),
+                    [root, other])
+            self.assertEqual(Tree.search([
+                        ('parent', 'child_of', [root.id]),
+                        ], order=[('id', 'ASC')]),
+                [root, child, grandchild])
+
+            transaction.cursor.rollback()
+
+    def test0090check_recursion(self):
+        'Test check_recursion'
+        Tree = POOL.get('test.tree')
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            root, = Tree.create([{'name': 'Root'}])
+            child, = Tree.create([{'name': 'Child', 'parent': root.id}])
+            self.assertRaises(UserError, Tree.write, [root], {
+                    'parent': child.id,
+                    })
+
+            root, = Tree.create([{'name': 'Root'}])
+            child, = Tree.create([{
+                        'name': 'Child',
+                        'parents': [('add', [root.id])],
+                        }])
+            self.assertRaises(UserError, Tree.write, [root], {
+                    'parents': [('add', [child.id])],
+                    })
+
+            transaction.cursor.rollback()
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(MPTTTestCase)
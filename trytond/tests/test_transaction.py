@@ -83,6 +83,27 @@ class TransactionTestCase(unittest.TestCase):
             with Transaction().set_user(2):
                 self.assertEqual(transaction.user, 2)
 
+    def test0040context_fingerprint(self):
+        'Test context_fingerprint'
+        with Transaction().start(DB_NAME, USER, context={'foo': [1]}) \
+                as transaction:
+            fingerprint = transaction.context_fingerprint()
+            self.assertEqual(fingerprint, frozenset([('foo', (1,))]))
+            self.assertIs(transaction.context_fingerprint(), fingerprint)
+
+            with transaction.set_context(bar=2):
+                self.assertEqual(transaction.context_fingerprint(),
+                    frozenset([('foo', (1,)), ('bar', 2)]))
+                self.assertEqual(
+                    transaction.context_fingerprint(frozenset(['bar'])),
+                    frozenset([('bar', 2)]))
+            self.assertIs(transaction.context_fingerprint(), fingerprint)
+
+            with transaction.reset_context():
+                self.assertEqual(transaction.context_fingerprint(),
+                    frozenset())
+            self.assertIs(transaction.context_fingerprint(), fingerprint)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TransactionTestCase)
@@ -1,5 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import time
 from threading import local
 from sql import Flavor
 
@@ -66,6 +67,8 @@ class Transaction(local):
     delete_records = None
     delete = None  # TODO check to merge with delete_records
     timestamp = None
+    started = None
+    _context_fingerprints = None
 
     def start(self, database_name, user, readonly=False, context=None,
             close=False, autocommit=False):
@@ -90,11 +93,13 @@ class Transaction(local):
         self.cursor = cursor
         self.close = close
         self.context = context or {}
+        self._context_fingerprints = None
         self.create_records = {}
         self.delete_records = {}
         self.delete = {}
         self.timestamp = {}
         self.counter = 0
+        self.started = time.time()
         return _TransactionManager()
 
     def stop(self):
@@ -109,15 +114,18 @@ class Transaction(local):
             self.close = None
             self.user = None
             self.context = None
+            self._context_fingerprints = None
             self.create_records = None
             self.delete_records = None
             self.delete = None
             self.timestamp = None
+            self.started = None
 
     def set_context(self, context=None, **kwargs):
         if context is None:
             context = {}
-        manager = _AttributeManager(context=self.context)
+        manager = _AttributeManager(context=self.context,
+            _context_fingerprints=self._context_fingerprints)
         self.context = self.context.copy()
         self.context.update(context)
         if kwargs:
@@ -125,7 +133,8 @@ class Transaction(local):
         return manager
 
     def reset_context(self):
-        manager = _AttributeManager(context=self.context)
+        manager = _AttributeManager(context=self.context,
+            _context_fingerprints=self._context_fingerprints)
         self.context = {}
         return manager
 
@@ -133,7 +142,8 @@ class Transaction(local):
         if user != 0 and set_context:
             raise ValueError('set_context only allowed for root')
         manager = _AttributeManager(user=self.user,
-                context=self.context)
+                context=self.context,
+                _context_fingerprints=self._context_fingerprints)
         self.context = self.context.copy()
         if set_context:
             if user != self.user:
@@ -155,6 +165,28 @@ class Transaction(local):
         self.cursor = database.cursor(autocommit=autocommit, readonly=readonly)
         return manager
 
+    def context_fingerprint(self, keys=None):
+        '''
+        Return an immutable fingerprint of the context limited to the keys.
+        It is memoized until the context is replaced so the context must not
+        be modified in place.
+        '''
+        from trytond.cache import freeze
+        context = self.context
+        fingerprints = self._context_fingerprints
+        if fingerprints is None or fingerprints[0] is not context:
+            fingerprints = self._context_fingerprints = (context, {})
+        try:
+            return fingerprints[1][keys]
+        except KeyError:
+            if keys is None:
+                fingerprint = freeze(context)
+            else:
+                fingerprint = freeze(dict((k, context[k])
+                        for k in keys if k in context))
+            fingerprints[1][keys] = fingerprint
+            return fingerprint
+
     @property
     def language(self):
         def get_language():